@@ -11,6 +11,7 @@ class DonationAdmin(admin.ModelAdmin):
     list_display = ('id', 'amount', 'message', 'stream', 'donor', 'payment_method', 'status', 'transaction_id', 'created_at', 'updated_at')
     search_fields = ('transaction_id', 'donor__username', 'stream__title')
     list_filter = ('status', 'payment_method', 'created_at', 'updated_at')
+    list_select_related = ('stream', 'donor')
 
 # Register the Donation model with the custom admin class
 admin.site.register(Donation, DonationAdmin)
@@ -20,6 +21,7 @@ class StreamAdmin(admin.ModelAdmin):
     list_display = ('id', 'title', 'description', 'streamer', 'is_active', 'created_at', 'updated_at')
     search_fields = ('title', 'description', 'streamer__username')
     list_filter = ('is_active', 'created_at', 'updated_at')
+    list_select_related = ('streamer',)
 
 # Register the Stream model with the custom admin class
 admin.site.register(Stream, StreamAdmin)
@@ -30,6 +32,7 @@ class CommentAdmin(admin.ModelAdmin):
     list_display = ('id', 'content', 'stream', 'user', 'created_at', 'updated_at')
     search_fields = ('content', 'user__username', 'stream__title')
     list_filter = ('created_at', 'updated_at')
+    list_select_related = ('stream', 'user')
 
 # Register the Comment model with the custom admin class
 admin.site.register(Comment, CommentAdmin)
\ No newline at end of file
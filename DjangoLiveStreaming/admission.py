@@ -0,0 +1,60 @@
+# DjangoLiveStreaming/admission.py
+from collections import Counter
+
+from django.conf import settings
+
+PENDING_AUTH = 'pending_auth'
+AUTHENTICATED = 'authenticated'
+IDLE = 'idle'
+
+# Gauges of this process's StreamConsumer sockets by state, and counters of
+# sockets refused or reaped
+connection_stats = {
+    PENDING_AUTH: 0,
+    AUTHENTICATED: 0,
+    IDLE: 0,
+    'rejected_capacity': 0,
+    'rejected_ip': 0,
+    'auth_timeouts': 0,
+    'idle_timeouts': 0,
+}
+
+
+def client_ip(scope):
+    # Behind a proxy, run daphne with --proxy-headers so this is the real client
+    client = scope.get('client')
+    return client[0] if client else None
+
+
+class ConnectionAdmission:
+    """
+    Per-process WebSocket admission: at most STREAM_MAX_CONNECTIONS sockets
+    in total and STREAM_MAX_CONNECTIONS_PER_IP from one address, 0 meaning
+    unlimited. Sockets are admitted before the handshake is accepted.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.per_ip = Counter()
+
+    def admit(self, ip):
+        if settings.STREAM_MAX_CONNECTIONS and self.total >= settings.STREAM_MAX_CONNECTIONS:
+            connection_stats['rejected_capacity'] += 1
+            return False
+        if ip and settings.STREAM_MAX_CONNECTIONS_PER_IP and self.per_ip[ip] >= settings.STREAM_MAX_CONNECTIONS_PER_IP:
+            connection_stats['rejected_ip'] += 1
+            return False
+        self.total += 1
+        if ip:
+            self.per_ip[ip] += 1
+        return True
+
+    def release(self, ip):
+        self.total -= 1
+        if ip:
+            self.per_ip[ip] -= 1
+            if self.per_ip[ip] <= 0:
+                del self.per_ip[ip]
+
+
+admission = ConnectionAdmission()
@@ -0,0 +1,17 @@
+from django.apps import AppConfig
+
+
+class DjangoLiveStreamingConfig(AppConfig):
+    name = 'DjangoLiveStreaming'
+
+    def ready(self):
+        from celery.signals import before_task_publish, task_postrun, task_prerun
+        from . import instrumentation, metrics
+
+        instrumentation.install()
+        task_prerun.connect(instrumentation.task_prerun, dispatch_uid='task_query_prerun')
+        task_postrun.connect(instrumentation.task_postrun, dispatch_uid='task_query_postrun')
+        metrics.register_stats_collectors()
+        before_task_publish.connect(metrics.before_task_publish, dispatch_uid='task_metrics_publish')
+        task_prerun.connect(metrics.task_prerun, dispatch_uid='task_metrics_prerun')
+        task_postrun.connect(metrics.task_postrun, dispatch_uid='task_metrics_postrun')
@@ -0,0 +1,64 @@
+# DjangoLiveStreaming/batching.py
+import asyncio
+
+from django.conf import settings
+
+
+def join_frames(texts):
+    return '[' + ','.join(texts) + ']'
+
+
+def batch_window(stream_id):
+    """Coalescing window for a stream in seconds; 0 means unbatched."""
+    return settings.STREAM_BATCH_WINDOWS.get(stream_id, settings.STREAM_BATCH_WINDOW_MS) / 1000
+
+
+class FrameCoalescer:
+    """
+    Leading-edge coalescing of pre-encoded text frames.
+
+    The first frame after a quiet period is sent immediately. Frames that
+    arrive within ``window`` seconds of the last send are buffered and
+    flushed together as one JSON array, either when the window elapses or
+    when ``max_messages`` frames are waiting.
+    """
+
+    def __init__(self, send, window, max_messages):
+        self._send = send
+        self.window = window
+        self.max_messages = max_messages
+        self._buffer = []
+        self._last_sent = float('-inf')
+        self._timer = None
+
+    async def push(self, text):
+        now = asyncio.get_running_loop().time()
+        if not self._buffer and now - self._last_sent >= self.window:
+            self._last_sent = now
+            await self._send(text)
+            return
+
+        self._buffer.append(text)
+        if len(self._buffer) >= self.max_messages:
+            await self.flush()
+        elif self._timer is None:
+            delay = max(0.0, self.window - (now - self._last_sent))
+            self._timer = asyncio.ensure_future(self._flush_later(delay))
+
+    async def _flush_later(self, delay):
+        await asyncio.sleep(delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        self.cancel()
+        if not self._buffer:
+            return
+        texts, self._buffer = self._buffer, []
+        self._last_sent = asyncio.get_running_loop().time()
+        await self._send(texts[0] if len(texts) == 1 else join_frames(texts))
+
+    def cancel(self):
+        if self._timer is not None and self._timer is not asyncio.current_task():
+            self._timer.cancel()
+        self._timer = None
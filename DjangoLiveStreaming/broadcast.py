@@ -0,0 +1,76 @@
+# DjangoLiveStreaming/broadcast.py
+import json
+from dataclasses import dataclass
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .history import stream_history
+from .metrics import group_send_timer
+
+
+@dataclass(frozen=True)
+class MessageClass:
+    priority: int  # lower is sent first
+    droppable: bool  # may be shed when a connection falls behind
+    batched: bool  # may wait in a STREAM_BATCH_WINDOW_MS batch
+    replayed: bool  # kept in the stream history replayed on join
+
+
+MESSAGE_CLASSES = {
+    'donation': MessageClass(priority=0, droppable=False, batched=False, replayed=True),
+    'system': MessageClass(priority=1, droppable=False, batched=False, replayed=False),
+    'chat': MessageClass(priority=2, droppable=True, batched=True, replayed=True),
+}
+
+
+def message_kind(kind):
+    return kind if kind in MESSAGE_CLASSES else 'chat'
+
+
+def stream_group_name(stream_id):
+    return f'stream_{stream_id}'
+
+
+def encode_frame(message):
+    return json.dumps({'message': message})
+
+
+def build_stream_event(message, kind='chat'):
+    # The text frame is encoded once here and forwarded unchanged by every
+    # StreamConsumer in the group. ``kind`` names one of MESSAGE_CLASSES and
+    # decides its priority, batching and what a slow consumer may drop.
+    return {
+        'type': 'stream_message',
+        'kind': kind,
+        'text': encode_frame(message)
+    }
+
+
+def event_text(event):
+    text = event.get('text')
+    if text is None:
+        text = encode_frame(event['message'])
+    return text
+
+
+def is_replayed(kind):
+    return MESSAGE_CLASSES[message_kind(kind)].replayed
+
+
+def broadcast_to_stream(stream_id, message, kind='chat'):
+    channel_layer = get_channel_layer()
+    event = build_stream_event(message, kind)
+    with group_send_timer(message_kind(kind)):
+        async_to_sync(channel_layer.group_send)(stream_group_name(stream_id), event)
+    if is_replayed(kind):
+        stream_history.record(stream_id, event['text'])
+
+
+async def abroadcast_to_stream(stream_id, message, kind='chat', channel_layer=None):
+    channel_layer = channel_layer or get_channel_layer()
+    event = build_stream_event(message, kind)
+    with group_send_timer(message_kind(kind)):
+        await channel_layer.group_send(stream_group_name(stream_id), event)
+    if is_replayed(kind):
+        await stream_history.arecord(stream_id, event['text'])
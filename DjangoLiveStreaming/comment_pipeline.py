@@ -0,0 +1,137 @@
+# DjangoLiveStreaming/comment_pipeline.py
+import atexit
+import logging
+import threading
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Comment, Stream
+
+logger = logging.getLogger(__name__)
+
+
+class CommentPipeline:
+    """
+    Write-behind persistence for chat comments.
+
+    Callers broadcast first and then hand the comment to ``submit``; rows
+    are written with ``bulk_create`` by a background thread every
+    ``flush_interval`` seconds or as soon as ``batch_size`` comments are
+    waiting. The buffer is bounded: when it is full the submitting caller
+    flushes inline, which slows that caller down instead of growing memory.
+    """
+
+    def __init__(self, batch_size, flush_interval, max_buffer):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.stats = {'accepted': 0, 'persisted': 0, 'dropped': 0, 'flushes': 0}
+        self._buffer = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def _offer(self, comment):
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                return False
+            self._buffer.append(comment)
+            self.stats['accepted'] += 1
+            pending = len(self._buffer)
+        if self._thread is None:
+            self._start()
+        if pending >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def _build(self, stream_id, user_id, content):
+        # Stamped now, not when the batch is flushed
+        now = timezone.now()
+        return Comment(stream_id=stream_id, user_id=user_id, content=content, created_at=now, updated_at=now)
+
+    def _count(self, key, amount=1):
+        # Bumped from request threads and the flush thread
+        with self._lock:
+            self.stats[key] += amount
+
+    def submit(self, stream_id, user_id, content):
+        comment = self._build(stream_id, user_id, content)
+        while not self._offer(comment):
+            self.flush()
+
+    async def asubmit(self, stream_id, user_id, content):
+        comment = self._build(stream_id, user_id, content)
+        while not self._offer(comment):
+            await database_sync_to_async(self.flush)()
+
+    def flush(self):
+        with self._flush_lock:
+            while True:
+                with self._lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not batch:
+                    return
+                self._persist(batch)
+
+    def _persist(self, batch):
+        # WebSocket chat is queued for whatever stream id the URL named, so
+        # drop rows for missing streams before they fail the whole insert
+        stream_ids = set(Stream.objects.filter(id__in={c.stream_id for c in batch}).values_list('id', flat=True))
+        valid = [comment for comment in batch if comment.stream_id in stream_ids]
+        if len(valid) < len(batch):
+            self._count('dropped', len(batch) - len(valid))
+            batch = valid
+        try:
+            with transaction.atomic():
+                Comment.objects.bulk_create(batch)
+            self._count('persisted', len(batch))
+        except DatabaseError:
+            # One bad row (e.g. a deleted stream) must not lose the whole batch
+            logger.exception(f"Bulk insert of {len(batch)} comments failed, retrying row by row")
+            for comment in batch:
+                try:
+                    comment.pk = None
+                    comment.save(force_insert=True)
+                    self._count('persisted')
+                except DatabaseError:
+                    self._count('dropped')
+        self._count('flushes')
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='comment-pipeline', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Comment pipeline flush failed")
+            finally:
+                close_old_connections()
+
+    def shutdown(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval * 2)
+        self.flush()
+
+
+comment_pipeline = CommentPipeline(
+    settings.COMMENT_BATCH_SIZE,
+    settings.COMMENT_FLUSH_INTERVAL,
+    settings.COMMENT_MAX_BUFFER
+)
+atexit.register(comment_pipeline.shutdown)
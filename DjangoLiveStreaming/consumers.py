@@ -1,78 +1,181 @@
+import asyncio
 import json
 import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.contrib.auth import get_user_model
+from django.conf import settings
+from .admission import AUTHENTICATED, IDLE, PENDING_AUTH, admission, client_ip, connection_stats
+from .batching import FrameCoalescer, batch_window
+from .broadcast import abroadcast_to_stream, event_text, stream_group_name
+from .comment_pipeline import comment_pipeline
+from .fanout import RELAY, local_fanout
+from .history import stream_history
+from .instrumentation import instrument_handler
+from .metrics import forget_stream, ws_connections, ws_received, ws_sent
+from .outbound import OutboundQueue
+from .presence import presence
+from .token_cache import authenticate_token
 
-User = get_user_model()
 logger = logging.getLogger(__name__)
 
-async def get_user(user_id):
-    try:
-        return await User.objects.aget(id=user_id)
-    except User.DoesNotExist:
-        return None
+PING_FRAME = json.dumps({'type': 'ping'})
 
 class StreamConsumer(AsyncWebsocketConsumer):
+    coalescer = None
+    outbound = None
+    watchdog = None
+    admitted = False
+    state = None
+
+    @instrument_handler('ws:connect')
     async def connect(self):
         self.stream_id = self.scope['url_route']['kwargs']['stream_id']
-        self.group_name = f'stream_{self.stream_id}'
+        self.group_name = stream_group_name(self.stream_id)
         self.user_authenticated = False
+        self.client_ip = client_ip(self.scope)
+        # Refuse the handshake when this process or this address is at its limit
+        if not admission.admit(self.client_ip):
+            await self.close()
+            return
+        self.admitted = True
+        window = batch_window(self.stream_id)
+        if window > 0:
+            self.coalescer = FrameCoalescer(self.send_text, window, settings.STREAM_BATCH_MAX_MESSAGES)
+        # Donation and system frames skip the coalescer via send_text
+        self.outbound = OutboundQueue(
+            self.coalescer.push if self.coalescer else self.send_text,
+            self.send_text,
+            self.close,
+            settings.STREAM_OUTBOUND_MAX_QUEUE,
+            settings.STREAM_SLOW_CONSUMER_POLICY,
+            settings.STREAM_MAX_LAG_SECONDS
+        )
         await self.accept()
+        ws_connections.inc(self.stream_id)
+        await presence.connected(self.stream_id)
+        self.set_state(PENDING_AUTH)
+        self.last_seen = asyncio.get_running_loop().time()
+        if settings.STREAM_AUTH_TIMEOUT > 0:
+            self.watchdog = asyncio.ensure_future(self.expire_auth())
         logger.info(f"Connected to stream: {self.stream_id}")
 
+    @instrument_handler('ws:disconnect')
     async def disconnect(self, close_code):
+        if not self.admitted:
+            return
+        admission.release(self.client_ip)
+        if ws_connections.dec(self.stream_id) <= 0:
+            forget_stream(self.stream_id)
+        self.set_state(None)
+        if self.watchdog is not None:
+            self.watchdog.cancel()
+        if self.outbound is not None:
+            self.outbound.cancel()
+        if self.coalescer:
+            self.coalescer.cancel()
+        await presence.disconnected(self.stream_id)
         if self.user_authenticated:
-            await self.channel_layer.group_discard(
-                self.group_name,
-                self.channel_name
-            )
+            await self.leave_stream()
         logger.info(f"Disconnected from stream: {self.stream_id}")
 
+    @instrument_handler('ws:receive')
     async def receive(self, text_data):
+        # Any frame from the client proves it is alive
+        self.last_seen = asyncio.get_running_loop().time()
+        ws_received.inc(self.stream_id)
+        if self.state == IDLE:
+            self.set_state(AUTHENTICATED)
         try:
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type')
 
-            if message_type == 'authenticate':
-                token = text_data_json.get('token')
-                if token:
-                    try:
-                        unt_token = UntypedToken(token)
-                        user_id = unt_token["user_id"]
-                        self.scope['user'] = await get_user(user_id)
-                        if self.scope['user'] and self.scope['user'].is_authenticated:
-                            self.user_authenticated = True
-                            await self.channel_layer.group_add(
-                                self.group_name,
-                                self.channel_name
-                            )
-                            await self.send(text_data=json.dumps({'type': 'authentication_success'}))
-                        else:
-                            await self.send(text_data=json.dumps({'type': 'authentication_failure'}))
-                            await self.close(code=403)
-                    except (InvalidToken, TokenError) as e:
-                        await self.send(text_data=json.dumps({'type': 'authentication_failure'}))
-                        await self.close(code=403)
+            if message_type == 'pong':
+                pass
+            elif message_type == 'authenticate':
+                # Reuse the user resolved by TokenAuthMiddleware on the handshake
+                user = self.scope.get('user')
+                if not (user and user.is_authenticated):
+                    token = text_data_json.get('token')
+                    user = await authenticate_token(token) if token else None
+
+                if user and user.is_authenticated:
+                    self.scope['user'] = user
+                    self.user_authenticated = True
+                    self.set_state(AUTHENTICATED)
+                    self.start_keepalive()
+                    await self.join_stream()
+                    await self.send(text_data=json.dumps({'type': 'authentication_success'}))
+                    # Recent chat and donations, so the stream isn't blank until the next message
+                    history = await stream_history.aframe(self.stream_id)
+                    if history:
+                        await self.send_text(history)
+                    await presence.viewer_seen(self.stream_id, user.id)
                 else:
                     await self.send(text_data=json.dumps({'type': 'authentication_failure'}))
                     await self.close(code=403)
             elif self.user_authenticated:
                 message = text_data_json['message']
-                await self.channel_layer.group_send(
-                    self.group_name,
-                    {
-                        'type': 'stream_message',
-                        'message': message
-                    }
-                )
+                await abroadcast_to_stream(self.stream_id, message, channel_layer=self.channel_layer)
+                if isinstance(message, str) and message:
+                    await comment_pipeline.asubmit(self.stream_id, self.scope['user'].id, message)
         except json.JSONDecodeError:
             pass
 
+    def set_state(self, state):
+        if self.state:
+            connection_stats[self.state] -= 1
+        if state:
+            connection_stats[state] += 1
+        self.state = state
+
+    async def expire_auth(self):
+        await asyncio.sleep(settings.STREAM_AUTH_TIMEOUT)
+        if not self.user_authenticated:
+            connection_stats['auth_timeouts'] += 1
+            await self.close(code=4001)
+
+    def start_keepalive(self):
+        if self.watchdog is not None:
+            self.watchdog.cancel()
+            self.watchdog = None
+        if settings.STREAM_IDLE_TIMEOUT > 0:
+            self.watchdog = asyncio.ensure_future(self.keepalive())
+
+    async def keepalive(self):
+        # Ping after STREAM_PING_INTERVAL of client silence; close once the
+        # silence reaches STREAM_IDLE_TIMEOUT. The client answers {"type": "pong"}.
+        loop = asyncio.get_running_loop()
+        while True:
+            silence = loop.time() - self.last_seen
+            if silence >= settings.STREAM_IDLE_TIMEOUT:
+                connection_stats['idle_timeouts'] += 1
+                await self.close(code=4002)
+                return
+            if silence >= settings.STREAM_PING_INTERVAL and self.state != IDLE:
+                self.set_state(IDLE)
+                await self.send(text_data=PING_FRAME)
+            wait = settings.STREAM_IDLE_TIMEOUT if self.state == IDLE else settings.STREAM_PING_INTERVAL
+            await asyncio.sleep(self.last_seen + wait - loop.time())
+
+    async def join_stream(self):
+        if settings.STREAM_FANOUT_MODE == RELAY:
+            await local_fanout.subscribe(self.stream_id, self)
+        else:
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+
+    async def leave_stream(self):
+        if settings.STREAM_FANOUT_MODE == RELAY:
+            await local_fanout.unsubscribe(self.stream_id, self)
+        else:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
     async def stream_message(self, event):
-        message = event['message']
-        await self.send(text_data=json.dumps({
-            'message': message
-        }))
-        logger.info(f"Message sent to WebSocket: {message}")
+        # Forward the pre-encoded frame as-is; no per-socket encode or log.
+        # The bounded outbound queue decouples this from the socket's pace.
+        if self.outbound is not None:
+            await self.outbound.put(event.get('kind', 'chat'), event_text(event))
+        else:
+            await self.send_text(event_text(event))
+
+    async def send_text(self, text):
+        ws_sent.inc(self.stream_id)
+        await self.send(text_data=text)
@@ -0,0 +1,162 @@
+# DjangoLiveStreaming/db_router.py
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .instrumentation import current_recorder
+
+logger = logging.getLogger(__name__)
+
+# Seconds the replica is behind; 0 when it has replayed everything it received
+LAG_SQL = {
+    'postgresql': (
+        "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+        "THEN 0 ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    ),
+}
+
+
+class ReadRouting:
+    def __init__(self):
+        self.allowed = True
+
+
+# Set while a replica-eligible view runs; the first write of the request
+# turns it off so the request reads its own writes
+current_routing = ContextVar('current_read_routing', default=None)
+
+
+class ReplicaPool:
+    """
+    The DATABASE_REPLICAS aliases and their health, checked at most every
+    REPLICA_HEALTH_INTERVAL seconds per process. A replica that fails the
+    check or lags more than REPLICA_MAX_LAG_SECONDS is skipped until the
+    next one passes.
+    """
+
+    def __init__(self, aliases):
+        self.aliases = list(aliases)
+        self.stats = {'replica_reads': 0, 'primary_fallbacks': 0}
+        self._healthy = {alias: True for alias in self.aliases}
+        self._checked_at = {alias: float('-inf') for alias in self.aliases}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        healthy = [alias for alias in self.aliases if self.is_healthy(alias)]
+        if not healthy:
+            self.stats['primary_fallbacks'] += 1
+            return None
+        self.stats['replica_reads'] += 1
+        return random.choice(healthy)
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        with self._lock:
+            due = now - self._checked_at[alias] >= settings.REPLICA_HEALTH_INTERVAL
+            if due:
+                self._checked_at[alias] = now
+        if due:
+            self._healthy[alias] = self.check(alias)
+        return self._healthy[alias]
+
+    def check(self, alias):
+        connection = connections[alias]
+        # Not part of the request's query budget
+        token = current_recorder.set(None)
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL.get(connection.vendor, 'SELECT 0'))
+                lag = float(cursor.fetchone()[0] or 0)
+        except DatabaseError as e:
+            logger.warning(f"Replica {alias} is unavailable, reading from the primary: {e}")
+            connection.close()
+            return False
+        finally:
+            current_recorder.reset(token)
+        if lag > settings.REPLICA_MAX_LAG_SECONDS:
+            logger.warning(f"Replica {alias} is {lag:.1f}s behind, reading from the primary")
+            return False
+        return True
+
+
+replicas = ReplicaPool(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+    """
+    Writes, and reads outside a replica-eligible view, go to the primary.
+    Inside one, reads go to a healthy replica until the first write.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        if routing is None or not routing.allowed or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return replicas.choose() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        routing = current_routing.get()
+        if routing is not None:
+            routing.allowed = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the primary's data, so rows from either can be related
+        databases = {DEFAULT_DB_ALIAS, *replicas.aliases}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get the schema through replication
+        return db == DEFAULT_DB_ALIAS
+
+
+def _pin_key(user_id):
+    return f'db_pin:{user_id}'
+
+
+def pin_user(user_id):
+    """Read from the primary for this user for the next REPLICA_PIN_SECONDS."""
+    if replicas.aliases and user_id:
+        cache.set(_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+
+async def apin_user(user_id):
+    if replicas.aliases and user_id:
+        await cache.aset(_pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user_id):
+    return bool(user_id) and cache.get(_pin_key(user_id)) is not None
+
+
+class ReplicaReadMixin:
+    """
+    Viewset mixin: ``replica_actions`` read from a replica unless the user
+    wrote in the last REPLICA_PIN_SECONDS, and a successful write pins the
+    user to the primary for that long so they read their own writes.
+    """
+
+    replica_actions = ('list', 'retrieve')
+    _routing_token = None
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if replicas.aliases and self.action in self.replica_actions and not is_pinned(request.user.id):
+            self._routing_token = current_routing.set(ReadRouting())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if self._routing_token is not None:
+            current_routing.reset(self._routing_token)
+            self._routing_token = None
+        elif request.method not in SAFE_METHODS and response.status_code < 400 and request.user.is_authenticated:
+            pin_user(request.user.id)
+        return super().finalize_response(request, response, *args, **kwargs)
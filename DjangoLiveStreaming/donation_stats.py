@@ -0,0 +1,129 @@
+# DjangoLiveStreaming/donation_stats.py
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .broadcast import broadcast_to_stream
+from .models import Donation, StreamDonationStats, StreamDonorTotal
+
+
+def record_completed_donations(donations):
+    """
+    Fold newly completed donations into the per-stream aggregates. Must be
+    called inside the transaction that moved them to 'completed', exactly
+    once per donation.
+    """
+    adjust_donation_totals([(donation, 1) for donation in donations])
+
+
+def adjust_donation_totals(changes):
+    """
+    Apply ``(donation, sign)`` pairs to the per-stream aggregates: 1 adds a
+    completed donation, -1 takes one back out, e.g. the old version of an
+    edited or deleted donation. Must be called inside the transaction that
+    made the change.
+    """
+    stream_totals = defaultdict(lambda: [Decimal('0'), 0])
+    donor_totals = defaultdict(lambda: [Decimal('0'), 0])
+    for donation, sign in changes:
+        stream_totals[donation.stream_id][0] += sign * donation.amount
+        stream_totals[donation.stream_id][1] += sign
+        donor_totals[(donation.stream_id, donation.donor_id)][0] += sign * donation.amount
+        donor_totals[(donation.stream_id, donation.donor_id)][1] += sign
+    # An edit that kept the amount, stream and donor changes nothing
+    stream_totals = {key: value for key, value in stream_totals.items() if value != [0, 0]}
+    donor_totals = {key: value for key, value in donor_totals.items() if value != [0, 0]}
+
+    # Make sure every row exists with one INSERT, then add with F() updates
+    StreamDonationStats.objects.bulk_create(
+        [StreamDonationStats(stream_id=stream_id) for stream_id, (_, count) in stream_totals.items() if count > 0],
+        ignore_conflicts=True
+    )
+    for stream_id, (amount, count) in stream_totals.items():
+        StreamDonationStats.objects.filter(stream_id=stream_id).update(
+            total_amount=F('total_amount') + amount,
+            donation_count=F('donation_count') + count
+        )
+
+    StreamDonorTotal.objects.bulk_create(
+        [
+            StreamDonorTotal(stream_id=stream_id, donor_id=donor_id)
+            for (stream_id, donor_id), (_, count) in donor_totals.items() if count > 0
+        ],
+        ignore_conflicts=True
+    )
+    for (stream_id, donor_id), (amount, count) in donor_totals.items():
+        StreamDonorTotal.objects.filter(stream_id=stream_id, donor_id=donor_id).update(
+            total_amount=F('total_amount') + amount,
+            donation_count=F('donation_count') + count
+        )
+    if any(count < 0 for _, count in donor_totals.values()):
+        # Donors with nothing left drop off the leaderboard
+        StreamDonorTotal.objects.filter(
+            stream_id__in={stream_id for stream_id, _ in donor_totals}, donation_count=0
+        ).delete()
+
+    for stream_id in stream_totals:
+        transaction.on_commit(lambda stream_id=stream_id: publish_donation_stats(stream_id))
+
+
+def get_donation_stats(stream_id):
+    stats = StreamDonationStats.objects.filter(stream_id=stream_id).first()
+    top_donors = (
+        StreamDonorTotal.objects
+        .filter(stream_id=stream_id)
+        .order_by('-total_amount')
+        .values('donor_id', 'donor__username', 'total_amount', 'donation_count')[:settings.DONATION_LEADERBOARD_SIZE]
+    )
+    return {
+        'stream': int(stream_id),
+        'total_amount': str(stats.total_amount if stats else Decimal('0.00')),
+        'donation_count': stats.donation_count if stats else 0,
+        'top_donors': [
+            {
+                'donor': row['donor_id'],
+                'username': row['donor__username'],
+                'total_amount': str(row['total_amount']),
+                'donation_count': row['donation_count']
+            }
+            for row in top_donors
+        ]
+    }
+
+
+def publish_donation_stats(stream_id):
+    broadcast_to_stream(stream_id, {'type': 'donation_stats', **get_donation_stats(stream_id)}, 'system')
+
+
+@transaction.atomic
+def rebuild_donation_stats(stream_ids=None):
+    completed = Donation.objects.filter(status='completed')
+    stats = StreamDonationStats.objects.all()
+    donor_totals = StreamDonorTotal.objects.all()
+    if stream_ids is not None:
+        completed = completed.filter(stream_id__in=stream_ids)
+        stats = stats.filter(stream_id__in=stream_ids)
+        donor_totals = donor_totals.filter(stream_id__in=stream_ids)
+    stats.delete()
+    donor_totals.delete()
+
+    per_stream = completed.values('stream_id').annotate(total=Sum('amount'), count=Count('id'))
+    StreamDonationStats.objects.bulk_create([
+        StreamDonationStats(stream_id=row['stream_id'], total_amount=row['total'], donation_count=row['count'])
+        for row in per_stream
+    ], batch_size=1000)
+
+    per_donor = completed.values('stream_id', 'donor_id').annotate(total=Sum('amount'), count=Count('id'))
+    StreamDonorTotal.objects.bulk_create([
+        StreamDonorTotal(
+            stream_id=row['stream_id'],
+            donor_id=row['donor_id'],
+            total_amount=row['total'],
+            donation_count=row['count']
+        )
+        for row in per_donor
+    ], batch_size=1000)
+    return len(per_stream)
@@ -0,0 +1,156 @@
+# DjangoLiveStreaming/donations.py
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+
+from .donation_stats import record_completed_donations
+from .models import Donation
+
+
+# Allowed status changes. A gateway 'failed' can still be confirmed by the
+# streamer when a manual transfer arrives; 'completed' is final. Automatic
+# callers pass sources=PENDING_ONLY so they never override a failure.
+DONATION_TRANSITIONS = {
+    'pending': ('completed', 'failed'),
+    'failed': ('completed',),
+    'completed': (),
+}
+
+PENDING_ONLY = ('pending',)
+
+
+def transition_sources(target):
+    return [source for source, targets in DONATION_TRANSITIONS.items() if target in targets]
+
+
+def transition_donations(donation_ids, target, sources=None):
+    """
+    Move the given donations to ``target`` with one conditional UPDATE that
+    only matches rows in an allowed source status, so concurrent callers
+    and task retries change each donation at most once. ``sources``
+    narrows the allowed source statuses. Returns the donations this call
+    changed.
+    """
+    allowed = transition_sources(target)
+    sources = allowed if sources is None else [source for source in sources if source in allowed]
+    if not sources:
+        raise ValueError(f"No transition leads to {target!r}")
+
+    now = timezone.now()
+    with transaction.atomic():
+        updated = (
+            Donation.objects
+            .filter(id__in=donation_ids, status__in=sources)
+            .update(status=target, updated_at=now)
+        )
+        if not updated:
+            return []
+        # Rows carry this call's timestamp only if this UPDATE changed them
+        changed = list(Donation.objects.filter(id__in=donation_ids, status=target, updated_at=now))
+        if target == 'completed':
+            record_completed_donations(changed)
+    return changed
+
+
+def complete_donation(donation_id, sources=None):
+    """
+    Move a donation to 'completed'. Returns the donation, or None if it was
+    already completed or not in one of ``sources``.
+    """
+    changed = transition_donations([donation_id], 'completed', sources)
+    return changed[0] if changed else None
+
+
+def sweep_pending_donations(older_than, batch_size, max_batches=10):
+    """
+    Complete donations left 'pending' for longer than ``older_than``, e.g.
+    when their process_donation task was lost, ``batch_size`` at a time
+    through the (status, created_at) index.
+    """
+    cutoff = timezone.now() - older_than
+    swept = 0
+    for _ in range(max_batches):
+        ids = list(
+            Donation.objects
+            .filter(status='pending', created_at__lt=cutoff)
+            .order_by('created_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        swept += len(transition_donations(ids, 'completed', PENDING_ONLY))
+        if len(ids) < batch_size:
+            break
+    return swept
+
+
+# Keeps each IN (...) list under SQLite's bound-parameter limit
+RECONCILE_CHUNK_SIZE = 400
+
+
+def chunked(items, size=RECONCILE_CHUNK_SIZE):
+    for offset in range(0, len(items), size):
+        yield items[offset:offset + size]
+
+
+def reconcile_donations(items):
+    """
+    Apply payment provider results, ``[(transaction_id, status), ...]`` with
+    status 'completed' or 'failed', in one transaction. Only pending
+    donations change; everything else is reported back unchanged.
+
+    Returns one ``{'transaction_id', 'result', 'status'}`` dict per item, in
+    order, where result is 'completed', 'failed', 'unchanged', 'not_found'
+    or 'duplicate'.
+    """
+    wanted = {}
+    for transaction_id, status in items:
+        wanted.setdefault(transaction_id, status)
+
+    with transaction.atomic():
+        found = {}
+        for chunk in chunked(list(wanted)):
+            donations = (
+                Donation.objects
+                .select_for_update()
+                .filter(transaction_id__in=chunk)
+                .only('id', 'transaction_id', 'status', 'amount', 'stream_id', 'donor_id')
+            )
+            found.update((donation.transaction_id, donation) for donation in donations)
+
+        pending = [donation for donation in found.values() if donation.status == 'pending']
+        now = timezone.now()
+        for chunk in chunked(pending):
+            completed_ids = [donation.id for donation in chunk if wanted[donation.transaction_id] == 'completed']
+            Donation.objects.filter(id__in=[donation.id for donation in chunk], status='pending').update(
+                status=Case(When(id__in=completed_ids, then=Value('completed')), default=Value('failed')),
+                updated_at=now
+            )
+
+        applied = set()
+        for donation in pending:
+            donation.status = wanted[donation.transaction_id]
+            applied.add(donation.transaction_id)
+
+        # Aggregates and the stats push are per stream, not per donation
+        record_completed_donations([donation for donation in pending if donation.status == 'completed'])
+
+    results = []
+    seen = set()
+    for transaction_id, _ in items:
+        donation = found.get(transaction_id)
+        if transaction_id in seen:
+            result = 'duplicate'
+        elif donation is None:
+            result = 'not_found'
+        elif transaction_id in applied:
+            result = donation.status
+        else:
+            result = 'unchanged'
+        seen.add(transaction_id)
+        results.append({
+            'transaction_id': str(transaction_id),
+            'result': result,
+            'status': donation.status if donation else None,
+        })
+    return results
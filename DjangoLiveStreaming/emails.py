@@ -0,0 +1,161 @@
+# DjangoLiveStreaming/emails.py
+import logging
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .metrics import email_send
+from .models import QueuedEmail
+
+logger = logging.getLogger(__name__)
+
+# Cumulative counters for this worker process
+email_stats = {'sent': 0, 'failed': 0, 'retried': 0, 'batches': 0, 'seconds': 0.0}
+
+
+def queue_donation_notification(donation_id):
+    # Idempotent: a relayed event that runs twice queues nothing new
+    QueuedEmail.objects.bulk_create([
+        QueuedEmail(donation_id=donation_id, recipient_role='streamer'),
+        QueuedEmail(donation_id=donation_id, recipient_role='donor'),
+    ], ignore_conflicts=True)
+
+
+def pending_batch_ready():
+    due = QueuedEmail.objects.filter(status='pending', next_attempt_at__lte=timezone.now())
+    return due[:settings.EMAIL_BATCH_SIZE].count() >= settings.EMAIL_BATCH_SIZE
+
+
+def build_message(queued):
+    donation = queued.donation
+    from_email = f"{os.getenv('MAIL_FROM_NAME')} <{os.getenv('MAIL_FROM_EMAIL')}>"
+    if queued.recipient_role == 'streamer':
+        subject = f'New Donation - Rp {donation.amount}'
+        recipient = donation.stream.streamer.email
+        template = 'emails/donation_received_streamer.html'
+    else:
+        subject = f'Thank You for Your Donation - Rp {donation.amount}'
+        recipient = donation.donor.email
+        template = 'emails/donation_received_donor.html'
+
+    html_message = render_to_string(template, {'donation': donation})
+    message = EmailMessage(subject, html_message, from_email, [recipient])
+    message.content_subtype = 'html'
+    return message
+
+
+def claim_batch(batch_size):
+    # Lease the batch by pushing next_attempt_at forward, so the SMTP work
+    # happens outside the transaction and a crashed worker's batch is
+    # picked up again once the lease runs out.
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(
+            QueuedEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        QueuedEmail.objects.filter(id__in=ids).update(
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_LEASE_SECONDS)
+        )
+    return list(
+        QueuedEmail.objects
+        .filter(id__in=ids)
+        .select_related('donation__stream__streamer', 'donation__donor')
+        .order_by('id')
+    )
+
+
+def record_failure(queued, error):
+    queued.attempts += 1
+    queued.last_error = str(error)
+    if queued.attempts >= settings.EMAIL_MAX_ATTEMPTS:
+        queued.status = 'failed'
+    else:
+        delay = settings.EMAIL_RETRY_BACKOFF * 2 ** (queued.attempts - 1)
+        queued.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    queued.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+    return queued.status == 'failed'
+
+
+def fail_unsent(batch, error, result):
+    # Emails a broken connection never got to count an attempt too, so a
+    # dead server can't keep a batch leased and retried forever
+    for queued in batch:
+        outcome = 'failed' if record_failure(queued, error) else 'retried'
+        result[outcome] += 1
+
+
+def flush_email_queue(batch_size=None):
+    """
+    Send one batch of queued emails over a single backend connection.
+    Individual failures are retried with exponential backoff and do not
+    abort the rest of the batch. Delivered emails are marked sent even when
+    the connection is lost part way through.
+    """
+    batch = claim_batch(batch_size or settings.EMAIL_BATCH_SIZE)
+    result = {'sent': 0, 'failed': 0, 'retried': 0, 'seconds': 0.0, 'per_second': 0.0}
+    if not batch:
+        return result
+
+    start = time.monotonic()
+    sent_ids = []
+    timings = []
+    unsent, connection_error = [], None
+    connection = get_connection()
+    try:
+        try:
+            connection.open()
+        except Exception as e:
+            unsent, connection_error = batch, e
+        else:
+            for index, queued in enumerate(batch):
+                send_start = time.monotonic()
+                try:
+                    message = build_message(queued)
+                    message.connection = connection
+                    message.send(fail_silently=False)
+                except Exception as e:
+                    elapsed = time.monotonic() - send_start
+                    logger.warning(f"Email {queued.id} to {queued.recipient_role} failed: {e}")
+                    outcome = 'failed' if record_failure(queued, e) else 'retried'
+                    result[outcome] += 1
+                    timings.append((elapsed, (outcome,)))
+                    # The SMTP session may be unusable after an error
+                    try:
+                        connection.close()
+                        connection.open()
+                    except Exception as reconnect_error:
+                        unsent, connection_error = batch[index + 1:], reconnect_error
+                        break
+                else:
+                    sent_ids.append(queued.id)
+                    timings.append((time.monotonic() - send_start, ('sent',)))
+        if unsent:
+            logger.warning(f"Email connection failed, {len(unsent)} emails not sent: {connection_error}")
+            fail_unsent(unsent, connection_error, result)
+    finally:
+        QueuedEmail.objects.filter(id__in=sent_ids).update(status='sent', sent_at=timezone.now())
+        email_send.observe_many(timings)
+        connection.close()
+
+    result['sent'] = len(sent_ids)
+    result['seconds'] = time.monotonic() - start
+    result['per_second'] = result['sent'] / result['seconds'] if result['seconds'] else 0.0
+
+    for key in ('sent', 'failed', 'retried', 'seconds'):
+        email_stats[key] += result[key]
+    email_stats['batches'] += 1
+    logger.info(
+        f"Email batch: {result['sent']} sent, {result['retried']} retrying, {result['failed']} failed "
+        f"in {result['seconds']:.2f}s ({result['per_second']:.1f}/s)"
+    )
+    return result
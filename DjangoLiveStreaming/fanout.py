@@ -0,0 +1,126 @@
+# DjangoLiveStreaming/fanout.py
+import asyncio
+import logging
+
+from django.conf import settings
+
+from .broadcast import stream_group_name
+
+logger = logging.getLogger(__name__)
+
+GROUP = 'group'
+RELAY = 'relay'
+
+# Process-wide counters; deliveries / relayed is the local fan-out factor
+fanout_stats = {'relays': 0, 'relayed': 0, 'deliveries': 0, 'receive_errors': 0}
+
+# Backoff between receive retries after a channel-layer error, in seconds
+RETRY_INITIAL_DELAY = 0.1
+RETRY_MAX_DELAY = 5.0
+
+
+class StreamRelay:
+    """
+    One channel-layer subscription per process and stream. It joins
+    ``stream_<id>`` with a single channel and hands each event to every
+    local StreamConsumer watching the stream, so a group_send costs one
+    layer message per process instead of one per viewer.
+    """
+
+    def __init__(self, stream_id, channel_layer):
+        self.stream_id = stream_id
+        self.channel_layer = channel_layer
+        self.consumers = set()
+        self.channel = None
+        self._task = None
+        self._refresh_task = None
+        self._stopped = False
+
+    async def start(self):
+        self.channel = await self.channel_layer.new_channel('stream_relay.')
+        await self.channel_layer.group_add(stream_group_name(self.stream_id), self.channel)
+        if self._stopped:
+            # The last viewer left while we were joining
+            await self.channel_layer.group_discard(stream_group_name(self.stream_id), self.channel)
+            return
+        self._task = asyncio.ensure_future(self._run())
+        self._refresh_task = asyncio.ensure_future(self._refresh())
+        fanout_stats['relays'] += 1
+
+    async def stop(self):
+        self._stopped = True
+        if self._task is None:
+            # Still starting; start() leaves the group itself
+            return
+        self._task.cancel()
+        self._refresh_task.cancel()
+        fanout_stats['relays'] -= 1
+        await self.channel_layer.group_discard(stream_group_name(self.stream_id), self.channel)
+
+    async def _refresh(self):
+        # The layer expires group memberships (channels_redis group_expiry,
+        # a day by default), so join again well before that
+        while True:
+            await asyncio.sleep(settings.STREAM_RELAY_REFRESH_INTERVAL)
+            try:
+                await self.channel_layer.group_add(stream_group_name(self.stream_id), self.channel)
+            except Exception as e:
+                logger.warning(f"Relay for stream {self.stream_id} failed to refresh its group: {e!r}")
+
+    async def _run(self):
+        delay = RETRY_INITIAL_DELAY
+        rejoin = False
+        while True:
+            try:
+                if rejoin:
+                    # The layer may have dropped the membership while it was unreachable
+                    await self.channel_layer.group_add(stream_group_name(self.stream_id), self.channel)
+                    rejoin = False
+                event = await self.channel_layer.receive(self.channel)
+            except Exception as e:
+                # Keep the relay alive, or its viewers would silently stop getting messages
+                fanout_stats['receive_errors'] += 1
+                logger.warning(f"Relay for stream {self.stream_id} failed to receive, retrying in {delay:.1f}s: {e!r}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX_DELAY)
+                rejoin = True
+                continue
+            delay = RETRY_INITIAL_DELAY
+            if event.get('type') != 'stream_message':
+                continue
+            consumers = list(self.consumers)
+            for consumer in consumers:
+                try:
+                    await consumer.stream_message(event)
+                except Exception:
+                    logger.exception(f"Local fan-out to a consumer of stream {self.stream_id} failed")
+            fanout_stats['relayed'] += 1
+            fanout_stats['deliveries'] += len(consumers)
+
+
+class LocalFanout:
+    """Registry of this process's StreamRelays, started and stopped on demand."""
+
+    def __init__(self):
+        self.relays = {}
+
+    async def subscribe(self, stream_id, consumer):
+        relay = self.relays.get(stream_id)
+        if relay is None:
+            relay = self.relays[stream_id] = StreamRelay(stream_id, consumer.channel_layer)
+            relay.consumers.add(consumer)
+            await relay.start()
+        else:
+            relay.consumers.add(consumer)
+
+    async def unsubscribe(self, stream_id, consumer):
+        relay = self.relays.get(stream_id)
+        if relay is None:
+            return
+        relay.consumers.discard(consumer)
+        if not relay.consumers:
+            del self.relays[stream_id]
+            await relay.stop()
+
+
+local_fanout = LocalFanout()
@@ -0,0 +1,87 @@
+# DjangoLiveStreaming/fast_serializers.py
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .serializers import CommentSerializer, DonationSerializer, StreamSerializer
+
+# Field types whose representation differs from the raw database value
+CONVERTED_FIELDS = (
+    serializers.DateTimeField,
+    serializers.DateField,
+    serializers.DecimalField,
+    serializers.UUIDField,
+)
+
+
+def datetime_converter(field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    fast = (
+        settings.USE_TZ and getattr(field, 'timezone', None) is None
+        and isinstance(output_format, str) and output_format.lower() == ISO_8601
+    )
+    if not fast:
+        return lambda: field.to_representation
+
+    # Same output as DateTimeField.to_representation, with the current
+    # timezone looked up once per page instead of once per value
+    def bind():
+        tz = timezone.get_current_timezone()
+
+        def convert(value):
+            value = value.astimezone(tz).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return convert
+    return bind
+
+
+def converter_factory(field):
+    if isinstance(field, serializers.DateTimeField):
+        return datetime_converter(field)
+    if isinstance(field, CONVERTED_FIELDS):
+        return lambda: field.to_representation
+    return None
+
+
+class FastReader:
+    """
+    Read-only fast path producing the same dicts as ``serializer_class``
+    for a queryset, built from a ``values_list`` projection instead of
+    model instances and per-field serializer calls.
+    """
+
+    def __init__(self, serializer_class):
+        fields = [
+            (name, field) for name, field in serializer_class().fields.items()
+            if not field.write_only
+        ]
+        self.names = tuple(name for name, _ in fields)
+        self.converter_factories = tuple(converter_factory(field) for _, field in fields)
+
+    def index(self, name):
+        return self.names.index(name)
+
+    def fetch(self, queryset):
+        return list(queryset.values_list(*self.names))
+
+    def to_dicts(self, rows):
+        names = self.names
+        converters = [factory() if factory else None for factory in self.converter_factories]
+        if not any(converters):
+            return [dict(zip(names, row)) for row in rows]
+        return [
+            dict(zip(names, [
+                convert(value) if convert is not None and value is not None else value
+                for convert, value in zip(converters, row)
+            ]))
+            for row in rows
+        ]
+
+    def read(self, queryset):
+        return self.to_dicts(self.fetch(queryset))
+
+
+stream_reader = FastReader(StreamSerializer)
+donation_reader = FastReader(DonationSerializer)
+comment_reader = FastReader(CommentSerializer)
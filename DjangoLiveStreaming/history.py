@@ -0,0 +1,134 @@
+# DjangoLiveStreaming/history.py
+import logging
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def history_frame(texts):
+    # Stored items are already-encoded {"message": ...} frames, oldest first
+    return '{"type": "history", "messages": [' + ','.join(texts) + ']}'
+
+
+class MemoryHistoryBackend:
+    """
+    Single-process backend, for development and the in-memory channel
+    layer. Keeps the last ``size`` frames of at most ``max_streams``
+    streams, evicting the least recently written stream.
+    """
+
+    def __init__(self, size, max_streams=10000):
+        self.size = size
+        self.max_streams = max_streams
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, stream_id, text):
+        with self._lock:
+            buffer = self._streams.get(stream_id)
+            if buffer is None:
+                buffer = self._streams[stream_id] = deque(maxlen=self.size)
+                if len(self._streams) > self.max_streams:
+                    self._streams.popitem(last=False)
+            else:
+                self._streams.move_to_end(stream_id)
+            buffer.append(text)
+
+    async def arecord(self, stream_id, text):
+        self.record(stream_id, text)
+
+    async def arecent(self, stream_id):
+        with self._lock:
+            return list(self._streams.get(stream_id, ()))
+
+
+class RedisHistoryBackend:
+    """
+    ``history:<stream>`` is a Redis list of encoded frames, newest first,
+    trimmed to ``size`` on every write and expired ``ttl`` seconds after
+    the last one.
+    """
+
+    def __init__(self, url, size, ttl):
+        import redis
+        import redis.asyncio
+
+        self.client = redis.Redis.from_url(url)
+        self.aclient = redis.asyncio.Redis.from_url(url)
+        self.size = size
+        self.ttl = ttl
+
+    def _write(self, pipe, stream_id, text):
+        key = f'history:{stream_id}'
+        pipe.lpush(key, text)
+        pipe.ltrim(key, 0, self.size - 1)
+        pipe.expire(key, self.ttl)
+
+    def record(self, stream_id, text):
+        pipe = self.client.pipeline(transaction=False)
+        self._write(pipe, stream_id, text)
+        pipe.execute()
+
+    async def arecord(self, stream_id, text):
+        pipe = self.aclient.pipeline(transaction=False)
+        self._write(pipe, stream_id, text)
+        await pipe.execute()
+
+    async def arecent(self, stream_id):
+        items = await self.aclient.lrange(f'history:{stream_id}', 0, self.size - 1)
+        return [item.decode() for item in reversed(items)]
+
+
+class StreamHistory:
+    """
+    Ring buffer of the last STREAM_HISTORY_SIZE broadcast frames per stream,
+    replayed to a viewer as one frame when they join.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def record(self, stream_id, text):
+        if self.backend is None:
+            return
+        try:
+            self.backend.record(stream_id, text)
+        except Exception:
+            logger.exception(f"Failed to record history for stream {stream_id}")
+
+    async def arecord(self, stream_id, text):
+        if self.backend is None:
+            return
+        try:
+            await self.backend.arecord(stream_id, text)
+        except Exception:
+            logger.exception(f"Failed to record history for stream {stream_id}")
+
+    async def aframe(self, stream_id):
+        """The replay frame for ``stream_id``, or None when there is nothing to replay."""
+        if self.backend is None:
+            return None
+        try:
+            texts = await self.backend.arecent(stream_id)
+        except Exception:
+            logger.exception(f"Failed to load history for stream {stream_id}")
+            return None
+        return history_frame(texts) if texts else None
+
+
+def get_history_backend():
+    if settings.STREAM_HISTORY_SIZE <= 0:
+        return None
+    if settings.STREAM_HISTORY_BACKEND == 'redis':
+        return RedisHistoryBackend(
+            settings.STREAM_HISTORY_REDIS_URL,
+            settings.STREAM_HISTORY_SIZE,
+            settings.STREAM_HISTORY_TTL
+        )
+    return MemoryHistoryBackend(settings.STREAM_HISTORY_SIZE)
+
+
+stream_history = StreamHistory(get_history_backend())
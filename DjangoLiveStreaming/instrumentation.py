@@ -0,0 +1,155 @@
+# DjangoLiveStreaming/instrumentation.py
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from .metrics import http_latency, http_queries, http_requests
+
+logger = logging.getLogger(__name__)
+
+current_recorder = ContextVar('current_query_recorder', default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryRecorder:
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.started = time.perf_counter()
+
+
+def record_execute(execute, sql, params, many, context):
+    # Installed on every connection; the recorder travels in a ContextVar,
+    # which sync_to_async copies into its worker thread, so ORM calls made
+    # from async handlers are attributed to the right request.
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.count += 1
+        recorder.seconds += time.perf_counter() - start
+
+
+def _install_wrapper(connection, **kwargs):
+    if record_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_execute)
+
+
+def install():
+    connection_created.connect(_install_wrapper, dispatch_uid='query_instrumentation')
+    for connection in connections.all(initialized_only=True):
+        _install_wrapper(connection)
+
+
+def get_budget(label):
+    return settings.QUERY_BUDGETS.get(label, settings.QUERY_BUDGET_DEFAULT)
+
+
+def check_budget(recorder, label=None):
+    label = label or recorder.label
+    budget = get_budget(label)
+    logger.debug(f"{label}: {recorder.count} queries in {recorder.seconds * 1000:.1f}ms")
+    if budget is None or recorder.count <= budget:
+        return
+    message = f"{label} ran {recorder.count} queries, budget is {budget}"
+    if settings.QUERY_BUDGET_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+@contextmanager
+def record_queries(label):
+    recorder = QueryRecorder(label)
+    token = current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        current_recorder.reset(token)
+
+
+def instrument_handler(label):
+    """Record queries and enforce the budget for an async consumer handler."""
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(*args, **kwargs):
+            with record_queries(label) as recorder:
+                result = await handler(*args, **kwargs)
+            check_budget(recorder)
+            return result
+        return wrapper
+    return decorator
+
+
+class QueryCountMiddleware:
+    """
+    Records the SQL query count and time of each request and checks it
+    against ``QUERY_BUDGETS[<url name>]``. With ``QUERY_COUNT_HEADERS`` the
+    numbers are also returned as X-Query-Count / X-Query-Time-Ms. Latency
+    and query count also feed the per-route /metrics histograms.
+    Async-capable, so it doesn't put async views behind a thread hop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        with record_queries(request.path) as recorder:
+            response = self.get_response(request)
+        return self.finish(request, response, recorder)
+
+    async def __acall__(self, request):
+        with record_queries(request.path) as recorder:
+            response = await self.get_response(request)
+        return self.finish(request, response, recorder)
+
+    def finish(self, request, response, recorder):
+        resolver_match = getattr(request, 'resolver_match', None)
+        route = resolver_match.view_name if resolver_match is not None else 'unmatched'
+        http_latency.observe(time.perf_counter() - recorder.started, route, request.method)
+        http_queries.observe(recorder.count, route)
+        http_requests.inc(route, request.method, str(response.status_code))
+        if resolver_match is not None:
+            check_budget(recorder, resolver_match.view_name)
+        if settings.QUERY_COUNT_HEADERS:
+            response['X-Query-Count'] = str(recorder.count)
+            response['X-Query-Time-Ms'] = f'{recorder.seconds * 1000:.2f}'
+        return response
+
+
+_task_recorders = {}
+
+
+def task_prerun(task_id=None, task=None, **kwargs):
+    recorder = QueryRecorder(f'task:{task.name}')
+    _task_recorders[task_id] = (recorder, current_recorder.set(recorder))
+
+
+def task_postrun(task_id=None, **kwargs):
+    entry = _task_recorders.pop(task_id, None)
+    if entry is None:
+        return
+    recorder, token = entry
+    current_recorder.reset(token)
+    check_budget(recorder)
@@ -0,0 +1,52 @@
+# DjangoLiveStreaming/live_directory.py
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .fast_serializers import stream_reader
+from .models import Stream
+from .pagination import get_limit, paginate_keyset
+
+VERSION_KEY = 'live_directory:version'
+
+
+def directory_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def invalidate_live_directory():
+    # Every cached page is keyed by the version, so bumping it drops them all
+    transaction.on_commit(_bump_version)
+
+
+def get_live_page(request):
+    """
+    Return ``(data, etag)`` for one page of active streams, from the cache
+    when possible.
+    """
+    after = request.query_params.get('after', '')
+    key = f'live_directory:{directory_version()}:{after}:{get_limit(request)}'
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    rows, next_cursor = paginate_keyset(Stream.objects.filter(is_active=True), request, stream_reader)
+    data = {'results': rows, 'next': next_cursor}
+    body = json.dumps(data, sort_keys=True, default=str).encode()
+    etag = f'"{hashlib.md5(body).hexdigest()}"'
+    cache.set(key, (data, etag), settings.LIVE_DIRECTORY_CACHE_TTL)
+    return data, etag
@@ -0,0 +1,246 @@
+import asyncio
+import itertools
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from asgiref.sync import ThreadSensitiveContext
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+
+from DjangoLiveStreaming.comment_pipeline import comment_pipeline
+from DjangoLiveStreaming.models import Donation, Stream
+from DjangoLiveStreaming.views import get_tokens_for_user
+
+from .bench_websocket import percentile
+
+User = get_user_model()
+
+BENCH_PASSWORD = 'bench-password'
+
+
+def create_pending_donations(stream_id, donor, count):
+    donations = Donation.objects.bulk_create([
+        Donation(amount='15000.00', stream_id=stream_id, donor=donor, payment_method='bank_transfer',
+                 transaction_id=uuid.uuid4())
+        for _ in range(count)
+    ], batch_size=1000)
+    return [donation.id for donation in donations]
+
+
+class Context:
+    """Accounts and ids shared by the endpoint callables of one run."""
+
+    def __init__(self, viewer, streamer, stream, hot_stream_id, pending_donation_ids):
+        self.viewer = viewer
+        self.stream_id = stream.id
+        self.hot_stream_id = hot_stream_id
+        # headers= works with both Client and AsyncClient
+        self.viewer_auth = {'headers': {'Authorization': f"Bearer {get_tokens_for_user(viewer)['access_token']}"}}
+        self.streamer_auth = {'headers': {'Authorization': f"Bearer {get_tokens_for_user(streamer)['access_token']}"}}
+        self._pending = iter(pending_donation_ids)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def next_pending_donation(self):
+        with self._lock:
+            donation_id = next(self._pending, None)
+        if donation_id is None:
+            # Past the seeded ones; confirming /None/ would only measure 404s
+            donation_id = create_pending_donations(self.stream_id, self.viewer, 1)[0]
+        return donation_id
+
+    def next_number(self):
+        with self._lock:
+            return next(self._counter)
+
+
+def post(client, path, data, auth):
+    return client.post(path, data=json.dumps(data), content_type='application/json', **auth)
+
+
+ENDPOINTS = {
+    'login': lambda c, ctx: post(c, '/api/login/', {'username': ctx.viewer.username, 'password': BENCH_PASSWORD}, {}),
+    'comment_create': lambda c, ctx: post(
+        c, '/api/comments/create/', {'content': 'benchmark comment', 'stream': ctx.stream_id}, ctx.viewer_auth
+    ),
+    # The same create through the DRF viewset, for comparison with the async view
+    'comment_create_drf': lambda c, ctx: post(
+        c, '/api/comments/', {'content': 'benchmark comment', 'stream': ctx.stream_id}, ctx.viewer_auth
+    ),
+    'comment_list': lambda c, ctx: c.get(f'/api/comments/?stream={ctx.hot_stream_id}&limit=50', **ctx.viewer_auth),
+    'comment_retrieve': lambda c, ctx: c.get(f'/api/comments/{ctx.hot_stream_id}/?limit=50', **ctx.viewer_auth),
+    'donation_create': lambda c, ctx: post(
+        c, '/api/donations/create/',
+        {'amount': '15000.00', 'message': 'benchmark', 'stream': ctx.stream_id, 'payment_method': 'bank_transfer'},
+        ctx.viewer_auth
+    ),
+    'donation_list': lambda c, ctx: c.get(f'/api/donations/?stream={ctx.hot_stream_id}&limit=50', **ctx.viewer_auth),
+    'donation_confirm': lambda c, ctx: post(
+        c, f'/api/donations/{ctx.next_pending_donation()}/confirm/', {}, ctx.viewer_auth
+    ),
+    'stream_list': lambda c, ctx: c.get('/api/streams/live/?limit=50', **ctx.viewer_auth),
+    'stream_start_stop': lambda c, ctx: post(
+        c, f"/api/streams/{ctx.stream_id}/{'start' if ctx.next_number() % 2 == 0 else 'stop'}/", {}, ctx.streamer_auth
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the hot REST endpoints under concurrency and report requests/sec, '
+        'latency percentiles and queries per request, optionally against a baseline'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=list(ENDPOINTS))
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--mode', choices=['sync', 'async'], default='sync',
+            help='sync: --concurrency threads through the WSGI-style handler; '
+                 'async: --concurrency tasks through the ASGI handler, as under daphne'
+        )
+        parser.add_argument('--requests', type=int, default=500, help='Requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=20, help='Unmeasured requests per endpoint')
+        parser.add_argument(
+            '--comments', type=int,
+            help='Build a dataset with this many comments with generate_dummy_data before running'
+        )
+        parser.add_argument('--users', type=int, default=1000, help='Users for --comments')
+        parser.add_argument('--baseline', help='Compare against the results in this JSON file')
+        parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative regression vs the baseline')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--output', help='Write the results as JSON to this file (use it as the next baseline)')
+
+    def handle(self, *args, **options):
+        if options['comments']:
+            call_command(
+                'generate_dummy_data', users=options['users'], comments=options['comments'],
+                donations=options['comments'] // 10, quiet=True, stdout=self.stdout
+            )
+
+        viewer, streamer, stream = self.seed()
+        hot_stream = (
+            Stream.objects.annotate(comment_total=Count('comments')).order_by('-comment_total').first()
+            or stream
+        )
+        # One pending donation for every donation_confirm request
+        confirms = (options['requests'] + options['warmup']) * options['endpoints'].count('donation_confirm')
+        pending = create_pending_donations(stream.id, viewer, confirms)
+        ctx = Context(viewer, streamer, stream, hot_stream.id, pending)
+
+        results = {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'database': connections['default'].vendor,
+            'concurrency': options['concurrency'],
+            'mode': options['mode'],
+            'requests': options['requests'],
+            'endpoints': {},
+        }
+        pool = ThreadPoolExecutor(options['concurrency'])
+        try:
+            with override_settings(QUERY_COUNT_HEADERS=True, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                self.stdout.write(
+                    f"{'endpoint':>18} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'errors':>7}"
+                )
+                for name in options['endpoints']:
+                    result = self.run(pool, ENDPOINTS[name], ctx, options)
+                    results['endpoints'][name] = result
+                    self.stdout.write(
+                        f"{name:>18} {result['rps']:>9,.1f} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                        f"{result['p99_ms']:>8.2f} {result['queries_per_request']:>8.1f} {result['errors']:>7}"
+                    )
+        finally:
+            pool.shutdown()
+            comment_pipeline.flush()
+            User.objects.filter(id__in=[viewer.id, streamer.id]).delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options['baseline']:
+            regressions = self.compare(results, options['baseline'], options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+
+    def seed(self):
+        suffix = uuid.uuid4().hex[:8]
+        viewer = User.objects.create_user(username=f'bench_api_viewer_{suffix}', password=BENCH_PASSWORD)
+        streamer = User.objects.create_user(username=f'bench_api_streamer_{suffix}', is_streamer=True)
+        stream = Stream.objects.create(title='Bench stream', description='benchmark', streamer=streamer)
+        return viewer, streamer, stream
+
+    def run(self, pool, endpoint, ctx, options):
+        def call(_):
+            client = Client(raise_request_exception=False)
+            start = time.perf_counter()
+            response = endpoint(client, ctx)
+            return time.perf_counter() - start, response.status_code, int(response.get('X-Query-Count', 0))
+
+        async def acall(semaphore):
+            # Like ASGIHandler, give each request its own thread for sync code
+            async with semaphore, ThreadSensitiveContext():
+                client = AsyncClient(raise_request_exception=False)
+                start = time.perf_counter()
+                response = await endpoint(client, ctx)
+                return time.perf_counter() - start, response.status_code, int(response.get('X-Query-Count', 0))
+
+        async def acalls(count):
+            semaphore = asyncio.Semaphore(options['concurrency'])
+            return await asyncio.gather(*[acall(semaphore) for _ in range(count)])
+
+        if options['mode'] == 'async':
+            calls = lambda count: asyncio.run(acalls(count))
+        else:
+            calls = lambda count: list(pool.map(call, range(count)))
+
+        calls(options['warmup'])
+        start = time.perf_counter()
+        samples = calls(options['requests'])
+        seconds = time.perf_counter() - start
+
+        latencies = [latency * 1000 for latency, _, _ in samples]
+        return {
+            'rps': len(samples) / seconds,
+            'p50_ms': percentile(latencies, 0.5),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'queries_per_request': sum(queries for _, _, queries in samples) / len(samples),
+            'errors': sum(1 for _, status, _ in samples if status >= 400),
+        }
+
+    def compare(self, results, baseline_path, tolerance):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+
+        regressions = []
+        for name, result in results['endpoints'].items():
+            base = baseline['endpoints'].get(name)
+            if base is None:
+                continue
+            if result['rps'] < base['rps'] * (1 - tolerance):
+                regressions.append(f"{name}: {result['rps']:,.1f} req/s, baseline {base['rps']:,.1f}")
+            if result['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p99 {result['p99_ms']:.2f}ms, baseline {base['p99_ms']:.2f}ms")
+            if result['queries_per_request'] > base['queries_per_request']:
+                regressions.append(
+                    f"{name}: {result['queries_per_request']:.1f} queries/request, "
+                    f"baseline {base['queries_per_request']:.1f}"
+                )
+
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f'REGRESSION {regression}'))
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS(f'No regressions against {baseline_path}'))
+        return regressions
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from DjangoLiveStreaming.broadcast import build_stream_event
+from DjangoLiveStreaming.consumers import StreamConsumer
+
+
+async def discard(message):
+    pass
+
+
+async def legacy_stream_message(consumer, event):
+    # The pre-encode-once handler: one json.dumps and one INFO-formatted
+    # string per socket.
+    message = event['message']
+    await consumer.send(text_data=json.dumps({'message': message}))
+    f"Message sent to WebSocket: {message}"
+
+
+class Command(BaseCommand):
+    help = 'Measure per-message CPU cost of StreamConsumer fan-out against the number of subscribers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, nargs='+', default=[1, 100, 1000, 10000])
+        parser.add_argument('--messages', type=int, default=20)
+        parser.add_argument('--payload-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        message = {'user': 'viewer', 'content': 'x' * options['payload_size']}
+        self.stdout.write(f"{'subscribers':>12} {'legacy ms/msg':>14} {'encode-once ms/msg':>19} {'speedup':>8}")
+        for subscribers in options['subscribers']:
+            legacy, encoded = asyncio.run(self.measure(subscribers, options['messages'], message))
+            self.stdout.write(
+                f'{subscribers:>12} {legacy * 1000:>14.3f} {encoded * 1000:>19.3f} {legacy / encoded:>7.1f}x'
+            )
+
+    async def measure(self, subscribers, messages, message):
+        consumers = []
+        for _ in range(subscribers):
+            consumer = StreamConsumer()
+            consumer.base_send = discard
+            # Not connected, so set what connect() would
+            consumer.stream_id = 0
+            consumers.append(consumer)
+
+        start = time.process_time()
+        for _ in range(messages):
+            event = {'type': 'stream_message', 'message': message}
+            for consumer in consumers:
+                await legacy_stream_message(consumer, event)
+        legacy = (time.process_time() - start) / messages
+
+        start = time.process_time()
+        for _ in range(messages):
+            event = build_stream_event(message)
+            for consumer in consumers:
+                await consumer.stream_message(event)
+        encoded = (time.process_time() - start) / messages
+
+        return legacy, encoded
@@ -0,0 +1,80 @@
+import time
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from DjangoLiveStreaming.fast_serializers import comment_reader, donation_reader, stream_reader
+from DjangoLiveStreaming.models import Comment, Donation, Stream
+from DjangoLiveStreaming.renderers import FastJSONRenderer
+from DjangoLiveStreaming.serializers import CommentSerializer, DonationSerializer, StreamSerializer
+
+User = get_user_model()
+
+TARGETS = {
+    'stream': (Stream, StreamSerializer, stream_reader),
+    'donation': (Donation, DonationSerializer, donation_reader),
+    'comment': (Comment, CommentSerializer, comment_reader),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare rows/sec of ModelSerializer + JSONRenderer against the projection fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000, help='Rows per model, created in a rolled-back transaction')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stream = self.seed(options['rows'])
+            self.stdout.write(f"{'model':>10} {'current rows/s':>15} {'fast rows/s':>12} {'speedup':>8}")
+            for name, (model, serializer_class, reader) in TARGETS.items():
+                queryset = model.objects.filter(stream=stream) if name != 'stream' else model.objects.all()
+                queryset = queryset.order_by('id')
+                current, fast, count = self.measure(queryset, serializer_class, reader, options['repeat'])
+                self.stdout.write(
+                    f'{name:>10} {count / current:>15,.0f} {count / fast:>12,.0f} {current / fast:>7.1f}x'
+                )
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        suffix = uuid.uuid4().hex[:8]
+        streamer = User.objects.create(username=f'bench_streamer_{suffix}', is_streamer=True)
+        viewer = User.objects.create(username=f'bench_viewer_{suffix}')
+        Stream.objects.bulk_create([
+            Stream(title=f'Bench stream {i}', description='benchmark', streamer=streamer, is_active=i % 2 == 0)
+            for i in range(rows)
+        ], batch_size=1000)
+        stream = Stream.objects.filter(streamer=streamer).first()
+        Donation.objects.bulk_create([
+            Donation(amount='12345.67', message=f'donation {i} ✓', stream=stream, donor=viewer, payment_method='bank_transfer')
+            for i in range(rows)
+        ], batch_size=1000)
+        Comment.objects.bulk_create([
+            Comment(content=f'comment {i} — hello', stream=stream, user=viewer)
+            for i in range(rows)
+        ], batch_size=1000)
+        return stream
+
+    def measure(self, queryset, serializer_class, reader, repeat):
+        def current_path():
+            data = serializer_class(queryset, many=True).data
+            return JSONRenderer().render({'code': 200, 'message': 'ok', 'data': data})
+
+        def fast_path():
+            return FastJSONRenderer().render({'code': 200, 'message': 'ok', 'data': reader.read(queryset)})
+
+        # tests.FastSerializerTests checks both paths render the same bytes
+        count = queryset.count()
+        return self.best_of(current_path, repeat), self.best_of(fast_path, repeat), count
+
+    def best_of(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
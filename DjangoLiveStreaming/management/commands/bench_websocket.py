@@ -0,0 +1,278 @@
+import asyncio
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timezone
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from DjangoLiveStreaming.batching import batch_window
+from DjangoLiveStreaming.broadcast import abroadcast_to_stream, stream_group_name
+from DjangoLiveStreaming.fanout import GROUP, RELAY, fanout_stats
+from DjangoLiveStreaming.models import Stream
+from DjangoLiveStreaming.history import MemoryHistoryBackend, stream_history
+from DjangoLiveStreaming.outbound import class_stats, outbound_stats
+from DjangoLiveStreaming.presence import MemoryPresenceBackend, presence
+from DjangoLiveStreaming.views import get_tokens_for_user
+
+User = get_user_model()
+
+MEMORY_LAYER = {'BACKEND': 'channels.layers.InMemoryChannelLayer', 'CONFIG': {'capacity': 100000}}
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def latency_summary(latencies):
+    latencies_ms = [latency * 1000 for latency in latencies]
+    return {
+        'p50': percentile(latencies_ms, 0.5),
+        'p99': percentile(latencies_ms, 0.99),
+        'p999': percentile(latencies_ms, 0.999),
+        'max': max(latencies_ms, default=None),
+    }
+
+
+def bench_messages(text):
+    # A frame is one {"message": ...} object, or a JSON array of them when
+    # STREAM_BATCH_WINDOW_MS coalesces frames
+    frame = json.loads(text)
+    for item in frame if isinstance(frame, list) else [frame]:
+        message = item.get('message') if isinstance(item, dict) else None
+        if isinstance(message, dict) and 'bench_seq' in message:
+            yield message
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive the ASGI application with simulated viewers on one stream and report '
+        'delivery throughput, p50/p99/p999 latency and memory per connection'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--layer', nargs='+', choices=['memory', 'redis'], default=['memory'])
+        parser.add_argument(
+            '--fanout', nargs='+', choices=[GROUP, RELAY], default=[settings.STREAM_FANOUT_MODE],
+            help='STREAM_FANOUT_MODE values to compare'
+        )
+        parser.add_argument('--redis-url', help='Channel layer Redis for --layer redis (default: CHANNEL_LAYERS)')
+        parser.add_argument('--clients', type=int, default=1000)
+        parser.add_argument('--viewers', type=int, default=100, help='Distinct viewer accounts shared by the clients')
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--rate', type=float, default=100.0, help='Published messages per second, 0 for unthrottled')
+        parser.add_argument('--donation-ratio', type=float, default=0.1)
+        parser.add_argument('--payload-size', type=int, default=100)
+        parser.add_argument('--connect-concurrency', type=int, default=200)
+        parser.add_argument('--drain-timeout', type=float, default=10.0)
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        streamer, viewers, stream = self.seed(options['viewers'])
+        tokens = [get_tokens_for_user(viewer)['access_token'] for viewer in viewers]
+        results = []
+        original_backend = presence.backend
+        original_history = stream_history.backend
+        try:
+            for layer in options['layer']:
+                if layer == 'memory':
+                    # Keep the run self-contained: no Redis for presence or history either
+                    presence.backend = MemoryPresenceBackend()
+                    if original_history is not None:
+                        stream_history.backend = MemoryHistoryBackend(settings.STREAM_HISTORY_SIZE)
+                    channel_layers = {'default': MEMORY_LAYER}
+                else:
+                    presence.backend = original_backend
+                    stream_history.backend = original_history
+                    channel_layers = self.redis_layers(options['redis_url'])
+
+                for fanout in options['fanout']:
+                    # The heartbeat task belongs to the previous run's event loop
+                    presence._task = None
+                    with override_settings(CHANNEL_LAYERS=channel_layers, STREAM_FANOUT_MODE=fanout):
+                        result = asyncio.run(self.run(stream.id, tokens, options))
+                    result['layer'] = layer
+                    result['fanout'] = fanout
+                    results.append(result)
+                    self.report(result)
+        finally:
+            presence.backend = original_backend
+            stream_history.backend = original_history
+            # Comments from the publisher are written behind; flush before
+            # the cascade delete so none arrive for a deleted stream
+            from DjangoLiveStreaming.comment_pipeline import comment_pipeline
+            comment_pipeline.flush()
+            User.objects.filter(id__in=[streamer.id] + [viewer.id for viewer in viewers]).delete()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def redis_layers(self, redis_url):
+        if not redis_url:
+            return settings.CHANNEL_LAYERS
+        return {'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': [redis_url]}}}
+
+    async def group_size(self, stream_id):
+        # Channels a group_send to the stream writes to: one per viewer in
+        # group mode, one per process in relay mode
+        layer = get_channel_layer()
+        group = stream_group_name(stream_id)
+        if hasattr(layer, 'groups'):
+            return len(layer.groups.get(group, {}))
+        connection = layer.connection(layer.consistent_hash(group))
+        return await connection.zcard(layer._group_key(group))
+
+    def seed(self, count):
+        suffix = uuid.uuid4().hex[:8]
+        streamer = User.objects.create(username=f'bench_streamer_{suffix}', is_streamer=True)
+        User.objects.bulk_create([User(username=f'bench_viewer_{suffix}_{i}') for i in range(count)])
+        viewers = list(User.objects.filter(username__startswith=f'bench_viewer_{suffix}_'))
+        stream = Stream.objects.create(title='Bench stream', description='benchmark', streamer=streamer, is_active=True)
+        return streamer, viewers, stream
+
+    async def connect_client(self, stream_id, token, semaphore):
+        async with semaphore:
+            communicator = WebsocketCommunicator(
+                self.application, f'/ws/stream/{stream_id}/',
+                headers=[(b'authorization', f'Bearer {token}'.encode())]
+            )
+            connected, _ = await communicator.connect(timeout=30)
+            if not connected:
+                return None
+            await communicator.send_to(text_data=json.dumps({'type': 'authenticate'}))
+            response = json.loads(await communicator.receive_from(timeout=30))
+            if response.get('type') != 'authentication_success':
+                await communicator.disconnect()
+                return None
+            return communicator
+
+    async def read_client(self, communicator, expected, drain_timeout, latencies):
+        received = 0
+        while received < expected:
+            try:
+                text = await communicator.receive_from(timeout=drain_timeout)
+            except asyncio.TimeoutError:
+                break
+            now = time.perf_counter()
+            for message in bench_messages(text):
+                latencies[message['kind']].append(now - message['sent'])
+                received += 1
+        return received
+
+    async def publish(self, stream_id, publisher, options):
+        padding = 'x' * options['payload_size']
+        interval = 1 / options['rate'] if options['rate'] else 0
+        layer = get_channel_layer()
+        start = time.perf_counter()
+        for seq in range(options['messages']):
+            if interval:
+                delay = start + seq * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            kind = 'donation' if random.random() < options['donation_ratio'] else 'chat'
+            message = {'bench_seq': seq, 'kind': kind, 'sent': time.perf_counter(), 'text': padding}
+            if kind == 'donation':
+                # Donations reach the group from the outbox relay, not a socket
+                await abroadcast_to_stream(stream_id, message, kind='donation', channel_layer=layer)
+            else:
+                await publisher.send_to(text_data=json.dumps({'message': message}))
+        return time.perf_counter() - start
+
+    async def run(self, stream_id, tokens, options):
+        from DjangoLiveStreaming.asgi import application
+        self.application = application
+        clients = options['clients']
+        semaphore = asyncio.Semaphore(options['connect_concurrency'])
+        stats_before = dict(outbound_stats)
+        class_stats_before = {kind: dict(stats) for kind, stats in class_stats.items()}
+
+        tracemalloc.start()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        communicators = await asyncio.gather(*[
+            self.connect_client(stream_id, tokens[i % len(tokens)], semaphore) for i in range(clients + 1)
+        ])
+        connect_seconds = time.perf_counter() - start
+        memory_after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        communicators = [c for c in communicators if c is not None]
+        publisher, viewers = communicators[0], communicators[1:]
+        group_size = await self.group_size(stream_id)
+        relayed_before = fanout_stats['relayed']
+        expected = options['messages']
+        latencies = {'chat': [], 'donation': []}
+        readers = [
+            asyncio.ensure_future(self.read_client(c, expected, options['drain_timeout'], latencies))
+            for c in communicators
+        ]
+
+        start = time.perf_counter()
+        publish_seconds = await self.publish(stream_id, publisher, options)
+        received = await asyncio.gather(*readers)
+        seconds = time.perf_counter() - start
+
+        await asyncio.gather(*[c.disconnect() for c in communicators], return_exceptions=True)
+
+        delivered = sum(received)
+        return {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'clients': clients,
+            'connected': len(communicators) - 1,
+            'messages': expected,
+            'donation_ratio': options['donation_ratio'],
+            'payload_size': options['payload_size'],
+            'publish_rate': options['rate'],
+            'batch_window_ms': round(batch_window(stream_id) * 1000),
+            'slow_consumer_policy': settings.STREAM_SLOW_CONSUMER_POLICY,
+            'group_size': group_size,
+            'relayed': fanout_stats['relayed'] - relayed_before,
+            'connect_seconds': connect_seconds,
+            'publish_seconds': publish_seconds,
+            'publish_ms_per_message': publish_seconds * 1000 / expected if expected else 0.0,
+            'seconds': seconds,
+            'expected': expected * len(communicators),
+            'delivered': delivered,
+            'lost': expected * len(communicators) - delivered,
+            'deliveries_per_second': delivered / seconds if seconds else 0.0,
+            'latency_ms': latency_summary(latencies['chat'] + latencies['donation']),
+            'latency_ms_by_kind': {kind: latency_summary(values) for kind, values in latencies.items()},
+            'memory_per_connection_bytes': (memory_after - memory_before) / max(len(communicators), 1),
+            'outbound': {key: outbound_stats[key] - stats_before[key] for key in outbound_stats},
+            'outbound_by_kind': {
+                kind: {key: stats[key] - class_stats_before[kind][key] for key in stats}
+                for kind, stats in class_stats.items()
+            },
+        }
+
+    def report(self, result):
+        latency = result['latency_ms']
+        fmt = lambda value: f'{value:.2f}' if value is not None else '-'
+        self.stdout.write(
+            f"[{result['layer']}/{result['fanout']}] {result['connected']}/{result['clients']} clients, "
+            f"{result['delivered']}/{result['expected']} deliveries in {result['seconds']:.2f}s "
+            f"({result['deliveries_per_second']:,.0f}/s)\n"
+            f"  latency ms p50={fmt(latency['p50'])} p99={fmt(latency['p99'])} "
+            f"p999={fmt(latency['p999'])} max={fmt(latency['max'])}\n"
+            + ''.join(
+                f"    {kind:<8} p50={fmt(values['p50'])} p99={fmt(values['p99'])} p999={fmt(values['p999'])}\n"
+                for kind, values in result['latency_ms_by_kind'].items()
+            ) +
+            f"  group_send fan-out {result['group_size']} channels, "
+            f"publish {result['publish_ms_per_message']:.2f} ms/message\n"
+            f"  connect {result['connect_seconds']:.2f}s, "
+            f"{result['memory_per_connection_bytes'] / 1024:.1f} KiB per connection, "
+            f"outbound {result['outbound']}"
+        )
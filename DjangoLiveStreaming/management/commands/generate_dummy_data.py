@@ -1,16 +1,68 @@
+import csv
+import io
+import itertools
 import random
-from django.core.management.base import BaseCommand
+import time
+import uuid
+from decimal import Decimal
+
 from django.contrib.auth import get_user_model
-from DjangoLiveStreaming.models import Stream, Donation, Comment
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
 from faker import Faker
 
+from DjangoLiveStreaming.donation_stats import rebuild_donation_stats
+from DjangoLiveStreaming.models import Comment, Donation, Stream
+
 User = get_user_model()
 
+PAYMENT_METHODS = ['credit_card', 'virtual_account', 'bank_transfer']
+DONATION_STATUSES = ['pending', 'completed', 'failed']
+
+# Faker is far too slow to call per row at millions of rows; rows draw
+# their text from pools generated once per run
+TEXT_POOL_SIZE = 1000
+
+
 class Command(BaseCommand):
     help = 'Generate dummy data for the application and create a superuser'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--streamer-ratio', type=float, default=0.5, help='Share of users that are streamers')
+        parser.add_argument('--streams', type=int, help='Total streams (default: 3 per streamer)')
+        parser.add_argument('--donations', type=int, help='Total donations (default: 5 per stream)')
+        parser.add_argument('--comments', type=int, help='Total comments (default: 10 per stream)')
+        parser.add_argument(
+            '--skew', type=float, default=0.0,
+            help='Zipf exponent of stream popularity for donations and comments; 0 is uniform, 1+ is a few hot streams'
+        )
+        parser.add_argument('--seed', type=int, help='Seed for a reproducible dataset')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT and per transaction')
+        parser.add_argument('--copy', action='store_true', help='Load donations and comments with COPY (PostgreSQL)')
+        parser.add_argument('--quiet', action='store_true')
+
+    def log(self, message):
+        if not self.quiet:
+            self.stdout.write(message)
+
+    def handle(self, *args, **options):
+        self.quiet = options['quiet']
+        self.batch_size = options['batch_size']
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy needs a PostgreSQL database')
+        self.copy = options['copy']
+
         fake = Faker('id_ID')
+        if options['seed'] is not None:
+            random.seed(options['seed'])
+            Faker.seed(options['seed'])
+        sentences = [fake.sentence() for _ in range(TEXT_POOL_SIZE)]
+        paragraphs = [fake.paragraph() for _ in range(TEXT_POOL_SIZE)]
+        names = [fake.user_name() for _ in range(TEXT_POOL_SIZE)]
 
         # Create superuser
         if not User.objects.filter(username='admin').exists():
@@ -19,55 +71,133 @@ class Command(BaseCommand):
                 email='admin@example.com',
                 password='admin'
             )
-            print('Superuser "admin" created with password "adminpassword"')
+            self.log('Superuser "admin" created with password "admin"')
 
-        # Create dummy users
+        # Create dummy users; every one gets password "password", hashed once
+        password = make_password('password')
+        first_id = (User.objects.aggregate(last=Max('id'))['last'] or 0) + 1
         users = []
-        for _ in range(10):
-            user = User.objects.create_user(
-                username=fake.user_name(),
-                email=fake.email(),
-                password='password',
-                is_streamer=fake.boolean()
-            )
-            users.append(user)
-            print(f"Created user: {user.username}")
+        for i in range(first_id, first_id + options['users']):
+            username = f'{random.choice(names)}{i}'
+            users.append(User(
+                username=username,
+                email=f'{username}@example.com',
+                password=password,
+                is_streamer=random.random() < options['streamer_ratio']
+            ))
+        self.insert_objects(User, users)
+        user_rows = list(User.objects.filter(id__gte=first_id).values_list('id', 'is_streamer'))
+        user_ids = [user_id for user_id, _ in user_rows]
+        streamer_ids = [user_id for user_id, is_streamer in user_rows if is_streamer]
+        donor_ids = [user_id for user_id, is_streamer in user_rows if not is_streamer] or user_ids
 
         # Create dummy streams
-        streams = []
-        for user in User.objects.filter(is_streamer=True):
-            for _ in range(3):
-                stream = Stream.objects.create(
-                    title=fake.sentence(),
-                    description=fake.paragraph(),
-                    streamer=user,
-                    is_active=fake.boolean()
-                )
-                streams.append(stream)
-                print(f"Created stream: {stream.title} by {user.username}")
+        stream_count = options['streams'] if options['streams'] is not None else 3 * len(streamer_ids)
+        if stream_count and not streamer_ids:
+            raise CommandError('No streamers to own the streams; raise --users or --streamer-ratio')
+        first_stream_id = (Stream.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        self.insert_objects(Stream, [
+            Stream(
+                title=random.choice(sentences),
+                description=random.choice(paragraphs),
+                streamer_id=random.choice(streamer_ids),
+                is_active=random.random() < 0.5
+            )
+            for _ in range(stream_count)
+        ])
+        stream_ids = list(Stream.objects.filter(id__gte=first_stream_id).order_by('id').values_list('id', flat=True))
+        if not stream_ids:
+            self.stdout.write(self.style.SUCCESS('Dummy data generated successfully'))
+            return
+
+        # Stream popularity follows a Zipf distribution over stream rank
+        weights = [1 / (rank + 1) ** options['skew'] for rank in range(len(stream_ids))]
+        cum_weights = list(itertools.accumulate(weights))
+
+        def pick_streams(k):
+            return random.choices(stream_ids, cum_weights=cum_weights, k=k)
 
         # Create dummy donations
-        donors = User.objects.exclude(is_streamer=True)
-        for stream in streams:
-            for _ in range(5):
-                donation = Donation.objects.create(
-                    amount=round(random.uniform(10000, 100000), 2),
-                    message=fake.sentence(),
-                    stream=stream,
-                    donor=random.choice(donors),
-                    payment_method=random.choice(['credit_card', 'virtual_account', 'bank_transfer']),
-                    status=random.choice(['pending', 'completed', 'failed']),
+        donation_count = options['donations'] if options['donations'] is not None else 5 * len(stream_ids)
+
+        native_uuid = connection.features.has_native_uuid_field
+
+        def donation_rows(k):
+            now = self.now()
+            return [
+                (
+                    Decimal(random.randrange(1000000, 10000000)) / 100,
+                    random.choice(sentences),
+                    stream_id,
+                    random.choice(donor_ids),
+                    random.choice(PAYMENT_METHODS),
+                    random.choice(DONATION_STATUSES),
+                    self.transaction_id(native_uuid),
+                    now,
+                    now,
                 )
-                print(f"Created donation: {donation.amount} to {stream.title}")
+                for stream_id in pick_streams(k)
+            ]
+
+        self.insert_rows(Donation, [
+            'amount', 'message', 'stream', 'donor', 'payment_method', 'status', 'transaction_id',
+            'created_at', 'updated_at',
+        ], donation_rows, donation_count)
 
         # Create dummy comments
-        for stream in streams:
-            for _ in range(10):
-                comment = Comment.objects.create(
-                    content=fake.sentence(),
-                    user=random.choice(users),
-                    stream=stream
-                )
-                print(f"Created comment: {comment.content} on {stream.title}")
+        comment_count = options['comments'] if options['comments'] is not None else 10 * len(stream_ids)
+
+        def comment_rows(k):
+            now = self.now()
+            return [
+                (random.choice(sentences), random.choice(user_ids), stream_id, now, now)
+                for stream_id in pick_streams(k)
+            ]
+
+        self.insert_rows(Comment, ['content', 'user', 'stream', 'created_at', 'updated_at'], comment_rows, comment_count)
+
+        # Completed donations feed the denormalized totals and leaderboards
+        rebuild_donation_stats(stream_ids)
 
         self.stdout.write(self.style.SUCCESS('Dummy data generated successfully'))
+
+    def insert_objects(self, model, objects):
+        start = time.monotonic()
+        for offset in range(0, len(objects), self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(objects[offset:offset + self.batch_size])
+        self.report(model, len(objects), start)
+
+    def now(self):
+        # One adapted timestamp per batch instead of a field conversion per row
+        return connection.ops.adapt_datetimefield_value(timezone.now())
+
+    def transaction_id(self, native_uuid):
+        value = uuid.UUID(int=random.getrandbits(128), version=4)
+        return value if native_uuid else value.hex
+
+    def insert_rows(self, model, fields, make_rows, count):
+        """
+        Insert ``count`` rows built by ``make_rows(k)`` as database-ready
+        tuples, skipping model instances and per-field ORM conversion.
+        """
+        start = time.monotonic()
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in fields)
+        for offset in range(0, count, self.batch_size):
+            rows = make_rows(min(self.batch_size, count - offset))
+            with transaction.atomic(), connection.cursor() as cursor:
+                if self.copy:
+                    buffer = io.StringIO()
+                    csv.writer(buffer).writerows(rows)
+                    buffer.seek(0)
+                    cursor.copy_expert(f'COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+                else:
+                    placeholders = ', '.join(['%s'] * len(fields))
+                    cursor.executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', rows)
+        self.report(model, count, start)
+
+    def report(self, model, count, start):
+        seconds = time.monotonic() - start
+        rate = count / seconds if seconds else 0
+        self.log(f'Created {count:,} {model._meta.verbose_name_plural} in {seconds:.1f}s ({rate:,.0f} rows/s)')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from DjangoLiveStreaming.donation_stats import rebuild_donation_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-stream donation totals and donor leaderboards from the Donation table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stream', type=int, nargs='*', dest='streams', help='Only rebuild these stream ids')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_donation_stats(options['streams'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt donation stats for {rebuilt} streams'))
@@ -0,0 +1,320 @@
+# DjangoLiveStreaming/metrics.py
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PREFIX = 'livestreaming_'
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# Failed reads and writes of the shared store; never retried or logged
+store_errors = {'errors': 0}
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=None):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    def __init__(self):
+        self._collectors = []
+
+    def register(self, collector):
+        self._collectors.append(collector)
+        return collector
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for collector in self._collectors:
+            for name, kind, help_text, samples in collector.collect():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {kind}')
+                for suffix, labels, value in samples:
+                    lines.append(f'{name}{suffix}{labels} {format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class Metric:
+    """
+    A labelled metric kept in this process. Updates take a short lock and
+    never await, so they are safe from both threads and async code.
+    """
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def remove(self, *label_values):
+        with self._lock:
+            self._values.pop(label_values, None)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def collect(self):
+        samples = [('', format_labels(self.labels, key), value) for key, value in self.snapshot().items()]
+        yield self.name, self.kind, self.help_text, samples
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, *label_values, value):
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        with self._lock:
+            value = self._values[label_values] = self._values.get(label_values, 0) - amount
+        return value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *label_values):
+        self.observe_many([(value, label_values)])
+
+    def observe_many(self, observations):
+        # Bucket counts are stored per bucket and made cumulative on render
+        with self._lock:
+            for value, label_values in observations:
+                entry = self._values.get(label_values)
+                if entry is None:
+                    entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+                entry[0][bisect.bisect_left(self.buckets, value)] += 1
+                entry[1] += value
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def collect(self):
+        samples = []
+        for key, (counts, total) in self.snapshot().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                samples.append(('_bucket', format_labels(self.labels, key, le), cumulative))
+            samples.append(('_sum', format_labels(self.labels, key), total))
+            samples.append(('_count', format_labels(self.labels, key), cumulative))
+        yield self.name, self.kind, self.help_text, samples
+
+
+class SharedHistogram(Histogram):
+    """
+    Histogram aggregated in the ``metrics:<name>`` Redis hash, for values
+    observed in Celery workers and read by the web process that serves
+    /metrics. Each observe_many is one pipelined round-trip. Without
+    METRICS_REDIS_URL it behaves like a Histogram.
+    """
+
+    _client = None
+
+    def client(self):
+        if not settings.METRICS_REDIS_URL:
+            return None
+        if self._client is None:
+            import redis
+            SharedHistogram._client = redis.Redis.from_url(settings.METRICS_REDIS_URL)
+        return self._client
+
+    def key(self):
+        return f'metrics:{self.name}'
+
+    def observe_many(self, observations):
+        client = self.client()
+        if client is None:
+            return super().observe_many(observations)
+        if not observations:
+            return
+        try:
+            pipe = client.pipeline(transaction=False)
+            for value, label_values in observations:
+                field = '\x1f'.join(label_values)
+                pipe.hincrby(self.key(), f'{field}|{bisect.bisect_left(self.buckets, value)}', 1)
+                pipe.hincrbyfloat(self.key(), f'{field}|sum', value)
+            pipe.execute()
+        except Exception:
+            store_errors['errors'] += 1
+
+    def snapshot(self):
+        client = self.client()
+        if client is None:
+            return super().snapshot()
+        try:
+            raw = client.hgetall(self.key())
+        except Exception:
+            # A scrape must not fail because the store is unreachable
+            store_errors['errors'] += 1
+            return {}
+        values = {}
+        for raw_field, raw_value in raw.items():
+            field, _, slot = raw_field.decode().rpartition('|')
+            key = tuple(field.split('\x1f')) if self.labels else ()
+            entry = values.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            if slot == 'sum':
+                entry[1] = float(raw_value)
+            else:
+                entry[0][int(slot)] = int(raw_value)
+        return values
+
+
+class StatsCollector:
+    """
+    Exposes an existing stats dict at scrape time, so the code keeping it
+    pays nothing extra. ``read`` returns ``{key: value}``, or with ``label``
+    ``{label_value: {key: value}}``; keys in ``gauges`` are gauges and the
+    rest counters.
+    """
+
+    def __init__(self, name, help_text, read, label=None, gauges=()):
+        self.name = PREFIX + name
+        self.help_text = help_text
+        self.read = read
+        self.label = label
+        self.gauges = set(gauges)
+        registry.register(self)
+
+    def collect(self):
+        stats = self.read()
+        rows = stats.items() if self.label else [(None, stats)]
+        families = {}
+        for label_value, values in rows:
+            labels = format_labels([self.label], [label_value]) if self.label else ''
+            for key, value in values.items():
+                families.setdefault(key, []).append(('', labels, value))
+        for key, samples in families.items():
+            if key in self.gauges:
+                yield f'{self.name}_{key}', 'gauge', f'{self.help_text}: {key}', samples
+            else:
+                yield f'{self.name}_{key}_total', 'counter', f'{self.help_text}: {key}', samples
+
+
+# HTTP, per URL name
+http_requests = Counter('http_requests_total', 'HTTP requests', ['route', 'method', 'status'])
+http_latency = Histogram('http_request_duration_seconds', 'HTTP request latency', ['route', 'method'])
+http_queries = Histogram('http_request_queries', 'SQL queries per HTTP request', ['route'], QUERY_BUCKETS)
+
+# WebSocket, per stream with viewers in this process
+ws_connections = Gauge('ws_connections', 'Open StreamConsumer sockets', ['stream'])
+ws_received = Counter('ws_messages_received_total', 'Frames received from viewers', ['stream'])
+ws_sent = Counter('ws_messages_sent_total', 'Stream frames sent to viewers', ['stream'])
+
+# Channel layer
+group_send_latency = Histogram('group_send_duration_seconds', 'Stream group_send latency', ['kind'])
+group_send_failures = Counter('group_send_failures_total', 'Stream group_send calls that raised', ['kind'])
+
+# Celery and email, observed in the workers
+task_duration = SharedHistogram('celery_task_duration_seconds', 'Celery task run time', ['task', 'state'])
+task_queue_lag = SharedHistogram(
+    'celery_queue_lag_seconds', 'Time from publishing a Celery task to a worker starting it', ['task'], LAG_BUCKETS
+)
+email_send = SharedHistogram('email_send_duration_seconds', 'Time to render and send one queued email', ['result'])
+
+
+def forget_stream(stream_id):
+    # Drop a stream's series once its last local viewer leaves
+    for metric in (ws_connections, ws_received, ws_sent):
+        metric.remove(stream_id)
+
+
+@contextmanager
+def group_send_timer(kind):
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        group_send_failures.inc(kind)
+        raise
+    finally:
+        group_send_latency.observe(time.perf_counter() - start, kind)
+
+
+_task_started = {}
+
+
+def before_task_publish(headers=None, **kwargs):
+    if headers is not None:
+        headers['enqueued_at'] = time.time()
+
+
+def task_prerun(task_id=None, task=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+    enqueued_at = task.request.get('enqueued_at')
+    if enqueued_at:
+        task_queue_lag.observe(max(time.time() - enqueued_at, 0.0), task.name)
+
+
+def task_postrun(task_id=None, task=None, state=None, **kwargs):
+    start = _task_started.pop(task_id, None)
+    if start is not None:
+        task_duration.observe(time.perf_counter() - start, task.name, state or 'UNKNOWN')
+
+
+def register_stats_collectors():
+    """Expose the stats dicts kept by the other modules; called once on startup."""
+    from .admission import connection_stats
+    from .comment_pipeline import comment_pipeline
+    from .db_router import replicas
+    from .fanout import fanout_stats
+    from .outbound import class_stats, outbound_stats
+    from .token_cache import token_user_cache
+
+    StatsCollector('ws_auth_cache', 'WebSocket token cache', token_user_cache.stats, gauges=['size'])
+    StatsCollector('ws_outbound', 'Slow WebSocket consumers', lambda: outbound_stats, gauges=['lagging'])
+    StatsCollector('ws_outbound_class', 'WebSocket outbound frames', lambda: class_stats, label='kind')
+    StatsCollector(
+        'ws_admission', 'WebSocket admission', lambda: connection_stats,
+        gauges=['pending_auth', 'authenticated', 'idle']
+    )
+    StatsCollector('ws_fanout', 'Relay fan-out', lambda: fanout_stats, gauges=['relays'])
+    StatsCollector('comment_pipeline', 'Write-behind comments', lambda: comment_pipeline.stats)
+    StatsCollector('db_replicas', 'Replica read routing', lambda: replicas.stats)
+    StatsCollector('metrics_store', 'Shared metric store', lambda: store_errors)
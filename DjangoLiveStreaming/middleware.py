@@ -1,19 +1,9 @@
 from urllib.parse import parse_qs
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from channels.middleware import BaseMiddleware
-from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.contrib.auth import get_user_model
-
-User = get_user_model()
-
-@database_sync_to_async
-def get_user(user_id):
-    try:
-        return User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        return AnonymousUser()
+from whitenoise.middleware import WhiteNoiseMiddleware
+from .token_cache import authenticate_token
 
 class TokenAuthMiddleware(BaseMiddleware):
     async def __call__(self, scope, receive, send):
@@ -21,23 +11,52 @@ class TokenAuthMiddleware(BaseMiddleware):
         token = headers.get(b"authorization", None)
         if token:
             token = token.decode().split(" ")[1]
-            try:
-                unt_token = UntypedToken(token)
-                user_id = unt_token["user_id"]
-                scope["user"] = await get_user(user_id)
-            except (InvalidToken, TokenError) as e:
-                print(f"Invalid token: {e}")
-                scope["user"] = AnonymousUser()
+            scope["user"] = await authenticate_token(token) or AnonymousUser()
         else:
             scope["user"] = AnonymousUser()
 
         return await super().__call__(scope, receive, send)
 
 class DisableCSRFMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request):
         setattr(request, '_dont_enforce_csrf_checks', True)
-        response = self.get_response(request)
-        return response
+        # Returns the coroutine as-is in async mode
+        return self.get_response(request)
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise is sync-only, which makes Django run every request below it
+    through a thread under ASGI. Outside autorefresh, finding a static file
+    is a dict lookup, so this serves those inline and awaits everything
+    else.
+    """
+
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = self.find_file(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
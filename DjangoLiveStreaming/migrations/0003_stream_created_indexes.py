@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DjangoLiveStreaming', '0002_alter_donation_transaction_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['stream', 'created_at', 'id'], name='comment_stream_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='donation',
+            index=models.Index(fields=['stream', 'created_at', 'id'], name='donation_stream_created_idx'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DjangoLiveStreaming', '0003_stream_created_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StreamDonationStats',
+            fields=[
+                ('stream', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='donation_stats', serialize=False, to='DjangoLiveStreaming.stream')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StreamDonorTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('donation_count', models.PositiveIntegerField(default=0)),
+                ('donor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stream_totals', to=settings.AUTH_USER_MODEL)),
+                ('stream', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='donor_totals', to='DjangoLiveStreaming.stream')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['stream', '-total_amount'], name='donor_total_leaderboard_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='streamdonortotal',
+            constraint=models.UniqueConstraint(fields=('stream', 'donor'), name='unique_stream_donor_total'),
+        ),
+    ]
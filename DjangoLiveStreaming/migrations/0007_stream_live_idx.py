@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DjangoLiveStreaming', '0006_queued_email'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stream',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='stream_live_idx'),
+        ),
+    ]
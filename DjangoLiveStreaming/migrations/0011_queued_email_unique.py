@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:04
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def drop_duplicates(apps, schema_editor):
+    # Keep the first row queued for each donation and recipient
+    QueuedEmail = apps.get_model('DjangoLiveStreaming', 'QueuedEmail')
+    keep = (
+        QueuedEmail.objects.values('donation_id', 'recipient_role')
+        .annotate(first_id=Min('id')).values_list('first_id', flat=True)
+    )
+    QueuedEmail.objects.exclude(id__in=list(keep)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('DjangoLiveStreaming', '0010_comment_submit_timestamps'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='queuedemail',
+            constraint=models.UniqueConstraint(fields=('donation', 'recipient_role'), name='unique_queued_email'),
+        ),
+    ]
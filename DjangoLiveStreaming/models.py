@@ -2,6 +2,7 @@
 import uuid
 
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 
 class User(AbstractUser):
@@ -16,6 +17,11 @@ class Stream(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], condition=models.Q(is_active=True), name='stream_live_idx'),
+        ]
+
 class Donation(models.Model):
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     message = models.TextField(blank=True)
@@ -27,9 +33,89 @@ class Donation(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['stream', 'created_at', 'id'], name='donation_stream_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='donation_status_created_idx'),
+        ]
+
 class Comment(models.Model):
     content = models.TextField()
     user = models.ForeignKey(User, related_name='comments', on_delete=models.CASCADE)
     stream = models.ForeignKey(Stream, related_name='comments', on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add / auto_now: the write-behind pipeline inserts comments
+    # after the fact and keeps the time they were submitted
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    updated_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stream', 'created_at', 'id'], name='comment_stream_created_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.updated_at = timezone.now()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'updated_at' not in update_fields:
+                kwargs['update_fields'] = [*update_fields, 'updated_at']
+        super().save(*args, **kwargs)
+
+class StreamDonationStats(models.Model):
+    stream = models.OneToOneField(Stream, related_name='donation_stats', on_delete=models.CASCADE, primary_key=True)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    donation_count = models.PositiveIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
+
+class StreamDonorTotal(models.Model):
+    stream = models.ForeignKey(Stream, related_name='donor_totals', on_delete=models.CASCADE)
+    donor = models.ForeignKey(User, related_name='stream_totals', on_delete=models.CASCADE)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    donation_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['stream', 'donor'], name='unique_stream_donor_total'),
+        ]
+        indexes = [
+            models.Index(fields=['stream', '-total_amount'], name='donor_total_leaderboard_idx'),
+        ]
+
+class OutboxEvent(models.Model):
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    dispatched_at = models.DateTimeField(null=True, blank=True)
+    # Set when the event ran out of attempts; it is kept for inspection
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['id'], condition=models.Q(dispatched_at__isnull=True, failed_at__isnull=True),
+                name='outbox_pending_idx'
+            ),
+            models.Index(fields=['dispatched_at'], name='outbox_dispatched_idx'),
+        ]
+
+class QueuedEmail(models.Model):
+    donation = models.ForeignKey(Donation, related_name='queued_emails', on_delete=models.CASCADE)
+    recipient_role = models.CharField(max_length=20)
+    status = models.CharField(max_length=20, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        # One email per recipient, however often the outbox relays the event
+        constraints = [
+            models.UniqueConstraint(fields=['donation', 'recipient_role'], name='unique_queued_email'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='queued_email_due_idx'),
+        ]
@@ -0,0 +1,143 @@
+# DjangoLiveStreaming/outbound.py
+import asyncio
+import logging
+from collections import deque
+
+from .broadcast import MESSAGE_CLASSES, message_kind
+
+logger = logging.getLogger(__name__)
+
+# Process-wide counters across all StreamConsumer connections
+outbound_stats = {'dropped': 0, 'lagging_disconnects': 0, 'overflow_disconnects': 0, 'lagging': 0}
+
+# The same, per message class; wait_seconds is total time spent queued
+class_stats = {
+    kind: {'queued': 0, 'delivered': 0, 'dropped': 0, 'wait_seconds': 0.0}
+    for kind in MESSAGE_CLASSES
+}
+
+DROP_CHAT = 'drop_chat'
+DISCONNECT = 'disconnect'
+
+# Lanes in drain order, and the droppable ones in shedding order
+LANE_ORDER = sorted(MESSAGE_CLASSES, key=lambda kind: MESSAGE_CLASSES[kind].priority)
+SHED_ORDER = [kind for kind in reversed(LANE_ORDER) if MESSAGE_CLASSES[kind].droppable]
+
+
+class OutboundQueue:
+    """
+    Bounded per-connection send queue drained by its own writer task, so a
+    slow socket never stalls the consumer's channel-layer receive loop.
+
+    Each message class has its own lane and the writer always drains the
+    highest-priority lane first. Unbatched classes go out through
+    ``deliver_now`` and skip the batching ``deliver``.
+
+    When the queue is full, a droppable frame sheds the oldest droppable
+    frame (``drop_chat``) or closes the socket (``disconnect``). A
+    non-droppable frame is always queued, shedding a droppable frame if
+    there is one; only a socket with twice ``max_size`` undroppable frames
+    waiting is closed. Independently, a connection whose oldest queued
+    frame is more than ``max_lag`` seconds old is closed.
+    """
+
+    def __init__(self, deliver, deliver_now, close, max_size, policy, max_lag):
+        self._deliver = deliver
+        self._deliver_now = deliver_now
+        self._close = close
+        self.max_size = max_size
+        self.policy = policy
+        self.max_lag = max_lag
+        self._lanes = {kind: deque() for kind in LANE_ORDER}
+        self._size = 0
+        self._ready = asyncio.Event()
+        self._lagging = False
+        self._closed = False
+        self._task = asyncio.ensure_future(self._run())
+
+    def __len__(self):
+        return self._size
+
+    async def put(self, kind, text):
+        if self._closed:
+            return
+        kind = message_kind(kind)
+        now = asyncio.get_running_loop().time()
+        if self.max_lag and self._size and now - self._oldest() > self.max_lag:
+            outbound_stats['lagging_disconnects'] += 1
+            await self._shutdown()
+            return
+
+        if self._size >= self.max_size:
+            if not MESSAGE_CLASSES[kind].droppable:
+                if not self._shed() and self._size >= 2 * self.max_size:
+                    outbound_stats['overflow_disconnects'] += 1
+                    await self._shutdown()
+                    return
+            elif self.policy == DISCONNECT:
+                outbound_stats['overflow_disconnects'] += 1
+                await self._shutdown()
+                return
+            elif not self._shed():
+                outbound_stats['dropped'] += 1
+                class_stats[kind]['dropped'] += 1
+                return
+
+        self._lanes[kind].append((text, now))
+        self._size += 1
+        class_stats[kind]['queued'] += 1
+        self._set_lagging(self._size > self.max_size // 2)
+        self._ready.set()
+
+    def _oldest(self):
+        return min(lane[0][1] for lane in self._lanes.values() if lane)
+
+    def _shed(self):
+        for kind in SHED_ORDER:
+            if self._lanes[kind]:
+                self._lanes[kind].popleft()
+                self._size -= 1
+                outbound_stats['dropped'] += 1
+                class_stats[kind]['dropped'] += 1
+                return True
+        return False
+
+    def _set_lagging(self, lagging):
+        if lagging != self._lagging:
+            outbound_stats['lagging'] += 1 if lagging else -1
+            self._lagging = lagging
+
+    async def _run(self):
+        while True:
+            kind = next((kind for kind in LANE_ORDER if self._lanes[kind]), None)
+            if kind is None:
+                self._set_lagging(False)
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            text, queued_at = self._lanes[kind].popleft()
+            self._size -= 1
+            stats = class_stats[kind]
+            stats['delivered'] += 1
+            stats['wait_seconds'] += asyncio.get_running_loop().time() - queued_at
+            try:
+                if MESSAGE_CLASSES[kind].batched:
+                    await self._deliver(text)
+                else:
+                    await self._deliver_now(text)
+            except Exception as e:
+                logger.debug(f"Outbound writer stopped: {e}")
+                return
+
+    async def _shutdown(self):
+        self.cancel()
+        await self._close(code=4008)
+
+    def cancel(self):
+        self._closed = True
+        self._set_lagging(False)
+        for lane in self._lanes.values():
+            lane.clear()
+        self._size = 0
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
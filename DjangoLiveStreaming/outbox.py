@@ -0,0 +1,96 @@
+# DjangoLiveStreaming/outbox.py
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(event, **payload):
+    """
+    Record a side effect to run once the surrounding transaction commits.
+    Call this inside the same transaction.atomic() block as the write it
+    belongs to.
+    """
+    return OutboxEvent.objects.create(kind=event, payload=payload)
+
+
+def enqueue_many(events):
+    """Like ``enqueue`` for several ``(event, payload)`` pairs, in one INSERT."""
+    return OutboxEvent.objects.bulk_create([
+        OutboxEvent(kind=event, payload=payload) for event, payload in events
+    ])
+
+
+def claim_events(batch_size):
+    # Lease the batch by pushing next_attempt_at forward, so the handlers run
+    # outside the transaction and its row locks, and a crashed relay's batch
+    # is picked up again once the lease runs out.
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects
+            .select_for_update(skip_locked=True)
+            .filter(dispatched_at__isnull=True, failed_at__isnull=True, next_attempt_at__lte=now)
+            .order_by('id')[:batch_size]
+        )
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(
+            next_attempt_at=now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)
+        )
+    return events
+
+
+def record_failure(event, error):
+    event.attempts += 1
+    event.last_error = str(error)
+    if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        event.failed_at = timezone.now()
+        logger.error(f"Outbox event {event.id} ({event.kind}) gave up after {event.attempts} attempts: {error}")
+    else:
+        delay = settings.OUTBOX_RETRY_BACKOFF * 2 ** (event.attempts - 1)
+        event.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    event.save(update_fields=['attempts', 'last_error', 'next_attempt_at', 'failed_at'])
+
+
+def relay_outbox(handlers, batch_size=100, max_batches=10):
+    """
+    Drain due outbox events in id order, ``batch_size`` at a time.
+
+    Each batch is claimed with SKIP LOCKED and a lease, so concurrent
+    relays never pick up the same event and no row lock is held while
+    handlers publish. An event whose handler raises is retried with
+    exponential backoff and marked failed after OUTBOX_MAX_ATTEMPTS.
+    Handlers run at least once, so they must tolerate a repeat.
+    """
+    dispatched = 0
+    for _ in range(max_batches):
+        events = claim_events(batch_size)
+        if not events:
+            break
+
+        done_ids = []
+        for event in events:
+            try:
+                handlers[event.kind](event.payload)
+            except Exception as e:
+                logger.exception(f"Outbox event {event.id} ({event.kind}) failed")
+                record_failure(event, e)
+            else:
+                done_ids.append(event.id)
+
+        OutboxEvent.objects.filter(id__in=done_ids).update(dispatched_at=timezone.now())
+        dispatched += len(done_ids)
+
+        if len(events) < batch_size:
+            break
+    return dispatched
+
+
+def purge_dispatched(older_than):
+    deleted, _ = OutboxEvent.objects.filter(dispatched_at__lt=timezone.now() - older_than).delete()
+    return deleted
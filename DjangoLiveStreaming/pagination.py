@@ -0,0 +1,77 @@
+# DjangoLiveStreaming/pagination.py
+import base64
+import binascii
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at, pk):
+    raw = f'{created_at.isoformat()}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, pk = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        created_at = None
+    if created_at is None:
+        raise InvalidCursor(cursor)
+    return created_at, pk
+
+
+def wants_keyset(request):
+    return 'after' in request.query_params or 'limit' in request.query_params
+
+
+def get_limit(request):
+    try:
+        limit = int(request.query_params.get('limit', settings.KEYSET_PAGE_SIZE))
+    except ValueError:
+        limit = settings.KEYSET_PAGE_SIZE
+    return max(1, min(limit, settings.KEYSET_MAX_PAGE_SIZE))
+
+
+def paginate_keyset(queryset, request, reader=None):
+    """
+    Slice ``queryset`` by ``(created_at, id)`` starting after the ``after``
+    cursor. Returns the page rows and the cursor of the next page, or None
+    when this is the last page. With a ``FastReader`` the rows are returned
+    as serialized dicts instead of model instances. Raises ``InvalidCursor``
+    for a malformed ``after``.
+    """
+    limit = get_limit(request)
+    queryset = queryset.order_by('created_at', 'id')
+
+    after = request.query_params.get('after')
+    if after:
+        created_at, pk = decode_cursor(after)
+        queryset = queryset.filter(
+            Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+        )
+
+    page = queryset[:limit + 1]
+    if reader is None:
+        rows = list(page)
+        last_key = lambda row: (row.created_at, row.pk)
+    else:
+        rows = reader.fetch(page)
+        created_at_index, id_index = reader.index('created_at'), reader.index('id')
+        last_key = lambda row: (row[created_at_index], row[id_index])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*last_key(rows[-1]))
+    if reader is not None:
+        rows = reader.to_dicts(rows)
+    return rows, next_cursor
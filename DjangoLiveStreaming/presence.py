@@ -0,0 +1,190 @@
+# DjangoLiveStreaming/presence.py
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import socket
+import time
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+
+from .broadcast import abroadcast_to_stream
+
+logger = logging.getLogger(__name__)
+
+
+class HyperLogLog:
+    """Fixed-size cardinality sketch, 2**precision one-byte registers."""
+
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(self.size)
+        self.alpha = 0.7213 / (1 + 1.079 / self.size)
+
+    def add(self, item):
+        digest = hashlib.blake2b(str(item).encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        index = value >> (64 - self.precision)
+        remainder = value & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - remainder.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        estimate = self.alpha * self.size * self.size / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            return round(self.size * math.log(self.size / zeros))
+        return round(estimate)
+
+
+class MemoryPresenceBackend:
+    """Single-process backend, for development and the in-memory channel layer."""
+
+    def __init__(self):
+        self.shards = defaultdict(dict)
+        self.uniques = defaultdict(HyperLogLog)
+
+    async def heartbeat(self, stream_id, worker_id, count, ttl):
+        self.shards[stream_id][worker_id] = (count, time.time() + ttl)
+
+    async def add_viewer(self, stream_id, user_id):
+        self.uniques[stream_id].add(user_id)
+
+    async def claim_push(self, stream_id, interval):
+        return True
+
+    def reset_unique(self, stream_id):
+        self.uniques.pop(stream_id, None)
+
+    def stats(self, stream_id):
+        now = time.time()
+        viewers = sum(count for count, expires in self.shards[stream_id].values() if expires > now)
+        unique = self.uniques[stream_id].count() if stream_id in self.uniques else 0
+        return {'viewers': viewers, 'unique_viewers': unique}
+
+    async def astats(self, stream_id):
+        return self.stats(stream_id)
+
+
+class RedisPresenceBackend:
+    """
+    Each worker process owns one field of ``presence:live:<stream>`` holding
+    ``count:expires_at``; readers sum the fields that have not expired, so a
+    crashed worker stops counting after one TTL. Unique viewers use PFADD /
+    PFCOUNT on ``presence:uniq:<stream>``.
+    """
+
+    def __init__(self, url):
+        import redis
+        import redis.asyncio
+
+        self.client = redis.Redis.from_url(url)
+        self.aclient = redis.asyncio.Redis.from_url(url)
+
+    async def heartbeat(self, stream_id, worker_id, count, ttl):
+        key = f'presence:live:{stream_id}'
+        await self.aclient.hset(key, worker_id, f'{count}:{time.time() + ttl}')
+        await self.aclient.expire(key, ttl * 2)
+
+    async def add_viewer(self, stream_id, user_id):
+        await self.aclient.pfadd(f'presence:uniq:{stream_id}', user_id)
+
+    async def claim_push(self, stream_id, interval):
+        return bool(await self.aclient.set(f'presence:push:{stream_id}', 1, nx=True, px=int(interval * 1000)))
+
+    def reset_unique(self, stream_id):
+        self.client.delete(f'presence:uniq:{stream_id}')
+
+    def _summarize(self, shards, unique):
+        now = time.time()
+        viewers = 0
+        for value in shards.values():
+            count, expires = value.decode().split(':')
+            if float(expires) > now:
+                viewers += int(count)
+        return {'viewers': viewers, 'unique_viewers': unique}
+
+    def stats(self, stream_id):
+        shards = self.client.hgetall(f'presence:live:{stream_id}')
+        return self._summarize(shards, self.client.pfcount(f'presence:uniq:{stream_id}'))
+
+    async def astats(self, stream_id):
+        shards = await self.aclient.hgetall(f'presence:live:{stream_id}')
+        return self._summarize(shards, await self.aclient.pfcount(f'presence:uniq:{stream_id}'))
+
+
+class PresenceTracker:
+    """
+    Per-process live socket counts per stream, published to the backend and
+    pushed to ``stream_<id>`` by a heartbeat task on the event loop.
+    """
+
+    def __init__(self, backend, interval, ttl):
+        self.backend = backend
+        self.interval = interval
+        self.ttl = ttl
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}'
+        self.local_counts = defaultdict(int)
+        self._task = None
+
+    def _ensure_heartbeat(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+
+    async def connected(self, stream_id):
+        self.local_counts[stream_id] += 1
+        self._ensure_heartbeat()
+
+    async def disconnected(self, stream_id):
+        self.local_counts[stream_id] -= 1
+
+    async def viewer_seen(self, stream_id, user_id):
+        try:
+            await self.backend.add_viewer(stream_id, user_id)
+        except Exception:
+            logger.exception(f"Failed to record viewer for stream {stream_id}")
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                await self.beat()
+            except Exception:
+                logger.exception("Presence heartbeat failed")
+            await asyncio.sleep(self.interval)
+
+    async def beat(self):
+        for stream_id, count in list(self.local_counts.items()):
+            await self.backend.heartbeat(stream_id, self.worker_id, count, self.ttl)
+            if count <= 0:
+                # Published the final zero; forget the stream unless a viewer
+                # joined while we were awaiting
+                if self.local_counts.get(stream_id) == 0:
+                    del self.local_counts[stream_id]
+                continue
+            if await self.backend.claim_push(stream_id, self.interval):
+                stats = await self.backend.astats(stream_id)
+                await abroadcast_to_stream(stream_id, {'type': 'viewer_stats', 'stream': stream_id, **stats}, 'system')
+
+    def stats(self, stream_id):
+        return self.backend.stats(stream_id)
+
+    def reset_unique(self, stream_id):
+        self.backend.reset_unique(stream_id)
+
+
+def get_presence_backend():
+    if settings.PRESENCE_BACKEND == 'redis':
+        return RedisPresenceBackend(settings.PRESENCE_REDIS_URL)
+    return MemoryPresenceBackend()
+
+
+presence = PresenceTracker(
+    get_presence_backend(),
+    settings.PRESENCE_HEARTBEAT_INTERVAL,
+    settings.PRESENCE_TTL
+)
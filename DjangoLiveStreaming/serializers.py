@@ -1,6 +1,9 @@
 # DjangoLiveStreaming/serializers.py
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db.models import Q
 from .models import Stream, Donation, Comment
 
 User = get_user_model()
@@ -9,17 +12,27 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password', 'is_streamer']
-        extra_kwargs = {'password': {'write_only': True}}
-
-    def validate_username(self, value):
-        if User.objects.filter(username=value).exists():
-            raise serializers.ValidationError("A user with that username already exists.")
-        return value
+        extra_kwargs = {
+            'password': {'write_only': True},
+            # Uniqueness is checked in validate() with a single query
+            'username': {'validators': [UnicodeUsernameValidator()]},
+        }
 
-    def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
-            raise serializers.ValidationError("A user with that email already exists.")
-        return value
+    def validate(self, attrs):
+        username = attrs.get('username')
+        email = attrs.get('email')
+        taken = User.objects.filter(Q(username=username) | Q(email=email))
+        if self.instance is not None:
+            taken = taken.exclude(pk=self.instance.pk)
+        errors = {}
+        for taken_username, taken_email in taken.values_list('username', 'email')[:2]:
+            if username is not None and taken_username == username:
+                errors['username'] = ["A user with that username already exists."]
+            if email is not None and taken_email == email:
+                errors['email'] = ["A user with that email already exists."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
 
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
@@ -44,7 +57,9 @@ class DonationSerializer(serializers.ModelSerializer):
         model = Donation
         fields = ['id', 'amount', 'message', 'stream', 'donor', 'payment_method', 'status', 'transaction_id', 'created_at', 'updated_at']
         extra_kwargs = {
-            'donor': {'required': False}
+            'donor': {'required': False},
+            # Status only changes through the transitions in donations.py
+            'status': {'read_only': True}
         }
 
     def create(self, validated_data):
@@ -65,4 +80,15 @@ class CommentSerializer(serializers.ModelSerializer):
         request = self.context.get('request', None)
         if request and request.user.is_authenticated:
             validated_data['user'] = request.user
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+class DonationResultSerializer(serializers.Serializer):
+    transaction_id = serializers.UUIDField()
+    status = serializers.ChoiceField(choices=['completed', 'failed'])
+
+class DonationBatchConfirmSerializer(serializers.Serializer):
+    donations = serializers.ListField(
+        child=DonationResultSerializer(),
+        allow_empty=False,
+        max_length=settings.DONATION_BATCH_MAX_ITEMS
+    )
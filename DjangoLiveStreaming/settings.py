@@ -12,6 +12,14 @@ DATABASES = {
     )
 }
 
+# Read replicas as comma-separated database URLs, added as replica_0, replica_1, ...
+DATABASE_REPLICA_URLS = [url for url in config('DATABASE_REPLICA_URLS', default='').split(',') if url]
+DATABASE_REPLICAS = []
+for index, url in enumerate(DATABASE_REPLICA_URLS):
+    DATABASES[f'replica_{index}'] = {**dj_database_url.parse(url), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica_{index}')
+DATABASE_ROUTERS = ['DjangoLiveStreaming.db_router.ReplicaRouter']
+
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = 'django-insecure-h#t4+gxd*y5%s=n9&_r67_p(m(e3iu_%gr@81!nnvw8v!ld^pl'
@@ -36,8 +44,9 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'DjangoLiveStreaming.middleware.DisableCSRFMiddleware',
+    'DjangoLiveStreaming.instrumentation.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'DjangoLiveStreaming.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -121,6 +130,10 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
     ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'DjangoLiveStreaming.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
 }
 
 SIMPLE_JWT = {
@@ -203,3 +216,190 @@ EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS') == 'true'
 EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL') == 'true'
 DEFAULT_FROM_EMAIL = os.getenv('MAIL_FROM_EMAIL')
+
+# Keyset (cursor) pagination for comments and donations
+KEYSET_PAGE_SIZE = config('KEYSET_PAGE_SIZE', default=50, cast=int)
+KEYSET_MAX_PAGE_SIZE = config('KEYSET_MAX_PAGE_SIZE', default=500, cast=int)
+
+# WebSocket frame coalescing: messages arriving within the window after a send
+# are flushed together as one JSON array frame. 0 disables batching.
+STREAM_BATCH_WINDOW_MS = config('STREAM_BATCH_WINDOW_MS', default=0, cast=int)
+STREAM_BATCH_MAX_MESSAGES = config('STREAM_BATCH_MAX_MESSAGES', default=50, cast=int)
+# Per-stream windows that override it, as "<stream id>:<ms>" pairs such as
+# "12:50,40:100", so only the hot streams need to batch
+STREAM_BATCH_WINDOWS = {
+    int(stream_id): int(window_ms)
+    for stream_id, window_ms in (pair.split(':') for pair in config('STREAM_BATCH_WINDOWS', default='').split(',') if pair)
+}
+
+# Verified token -> user cache shared by WebSocket handshake and in-band auth
+WS_AUTH_CACHE_SIZE = config('WS_AUTH_CACHE_SIZE', default=10000, cast=int)
+WS_AUTH_CACHE_TTL = config('WS_AUTH_CACHE_TTL', default=300, cast=int)
+
+# Number of donors returned by the per-stream donation leaderboard
+DONATION_LEADERBOARD_SIZE = config('DONATION_LEADERBOARD_SIZE', default=10, cast=int)
+
+# Max transaction results accepted by one /api/donations/batch_confirm/ call
+DONATION_BATCH_MAX_ITEMS = config('DONATION_BATCH_MAX_ITEMS', default=5000, cast=int)
+
+# Transactional outbox relay for donation side effects
+OUTBOX_RELAY_INTERVAL = config('OUTBOX_RELAY_INTERVAL', default=1.0, cast=float)
+OUTBOX_RELAY_BATCH_SIZE = config('OUTBOX_RELAY_BATCH_SIZE', default=100, cast=int)
+OUTBOX_RETENTION_HOURS = config('OUTBOX_RETENTION_HOURS', default=24, cast=int)
+OUTBOX_LEASE_SECONDS = config('OUTBOX_LEASE_SECONDS', default=60, cast=int)
+OUTBOX_MAX_ATTEMPTS = config('OUTBOX_MAX_ATTEMPTS', default=10, cast=int)
+OUTBOX_RETRY_BACKOFF = config('OUTBOX_RETRY_BACKOFF', default=5, cast=int)
+
+CELERY_BEAT_SCHEDULE = {
+    'relay-outbox-events': {
+        'task': 'DjangoLiveStreaming.tasks.relay_outbox_events',
+        'schedule': OUTBOX_RELAY_INTERVAL,
+    },
+    'purge-outbox-events': {
+        'task': 'DjangoLiveStreaming.tasks.purge_outbox_events',
+        'schedule': timedelta(hours=1),
+    },
+}
+
+# Batched donation email dispatch
+EMAIL_BATCH_SIZE = config('EMAIL_BATCH_SIZE', default=50, cast=int)
+EMAIL_FLUSH_INTERVAL = config('EMAIL_FLUSH_INTERVAL', default=5.0, cast=float)
+EMAIL_LEASE_SECONDS = config('EMAIL_LEASE_SECONDS', default=300, cast=int)
+EMAIL_MAX_ATTEMPTS = config('EMAIL_MAX_ATTEMPTS', default=5, cast=int)
+EMAIL_RETRY_BACKOFF = config('EMAIL_RETRY_BACKOFF', default=30, cast=int)
+
+CELERY_BEAT_SCHEDULE['flush-email-queue'] = {
+    'task': 'DjangoLiveStreaming.tasks.flush_email_queue_task',
+    'schedule': EMAIL_FLUSH_INTERVAL,
+}
+
+# Donations still pending after DONATION_SWEEP_AGE seconds are completed in bulk
+DONATION_SWEEP_INTERVAL = config('DONATION_SWEEP_INTERVAL', default=60.0, cast=float)
+DONATION_SWEEP_AGE = config('DONATION_SWEEP_AGE', default=300, cast=int)
+DONATION_SWEEP_BATCH_SIZE = config('DONATION_SWEEP_BATCH_SIZE', default=500, cast=int)
+
+CELERY_BEAT_SCHEDULE['sweep-pending-donations'] = {
+    'task': 'DjangoLiveStreaming.tasks.sweep_pending_donations_task',
+    'schedule': DONATION_SWEEP_INTERVAL,
+}
+
+# Write-behind comment persistence. WebSocket chat always goes through it;
+# COMMENT_WRITE_BEHIND also routes the REST create paths through it, which
+# answer 202 without an id instead of 201
+COMMENT_WRITE_BEHIND = config('COMMENT_WRITE_BEHIND', default=False, cast=bool)
+COMMENT_BATCH_SIZE = config('COMMENT_BATCH_SIZE', default=500, cast=int)
+COMMENT_FLUSH_INTERVAL = config('COMMENT_FLUSH_INTERVAL', default=0.5, cast=float)
+COMMENT_MAX_BUFFER = config('COMMENT_MAX_BUFFER', default=20000, cast=int)
+
+# Live viewer counts and unique-viewer estimates per stream ('redis' or 'memory')
+PRESENCE_BACKEND = config('PRESENCE_BACKEND', default='redis')
+PRESENCE_REDIS_URL = config(
+    'PRESENCE_REDIS_URL',
+    default=f"redis://{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', 6379)}/2"
+)
+PRESENCE_HEARTBEAT_INTERVAL = config('PRESENCE_HEARTBEAT_INTERVAL', default=5.0, cast=float)
+PRESENCE_TTL = config('PRESENCE_TTL', default=15, cast=int)
+
+# Slow WebSocket consumers: per-connection outbound queue bound, what to do when
+# it is full ('drop_chat' or 'disconnect'), and maximum lag before disconnect
+STREAM_OUTBOUND_MAX_QUEUE = config('STREAM_OUTBOUND_MAX_QUEUE', default=500, cast=int)
+STREAM_SLOW_CONSUMER_POLICY = config('STREAM_SLOW_CONSUMER_POLICY', default='drop_chat')
+STREAM_MAX_LAG_SECONDS = config('STREAM_MAX_LAG_SECONDS', default=10.0, cast=float)
+
+# Last STREAM_HISTORY_SIZE chat/donation frames per stream, replayed on join
+# ('redis' or 'memory'; 0 disables)
+STREAM_HISTORY_SIZE = config('STREAM_HISTORY_SIZE', default=50, cast=int)
+STREAM_HISTORY_BACKEND = config('STREAM_HISTORY_BACKEND', default='redis')
+STREAM_HISTORY_REDIS_URL = config('STREAM_HISTORY_REDIS_URL', default=PRESENCE_REDIS_URL)
+STREAM_HISTORY_TTL = config('STREAM_HISTORY_TTL', default=86400, cast=int)
+
+# 'group' adds every viewer's channel to the stream group; 'relay' adds one
+# channel per process and stream and fans out to local viewers in memory
+STREAM_FANOUT_MODE = config('STREAM_FANOUT_MODE', default='group')
+# Seconds between a relay's group_add refreshes; keep it below the channel
+# layer's group_expiry
+STREAM_RELAY_REFRESH_INTERVAL = config('STREAM_RELAY_REFRESH_INTERVAL', default=3600.0, cast=float)
+
+# WebSocket liveness and admission: seconds to send 'authenticate', client
+# silence before a ping and before the socket is closed (0 disables; only
+# for clients that answer the ping), and sockets per process and per client
+# address (0 is unlimited; the per-address limit needs daphne --proxy-headers
+# behind a proxy)
+STREAM_AUTH_TIMEOUT = config('STREAM_AUTH_TIMEOUT', default=10.0, cast=float)
+STREAM_PING_INTERVAL = config('STREAM_PING_INTERVAL', default=30.0, cast=float)
+STREAM_IDLE_TIMEOUT = config('STREAM_IDLE_TIMEOUT', default=0, cast=float)
+STREAM_MAX_CONNECTIONS = config('STREAM_MAX_CONNECTIONS', default=0, cast=int)
+STREAM_MAX_CONNECTIONS_PER_IP = config('STREAM_MAX_CONNECTIONS_PER_IP', default=0, cast=int)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f"redis://{os.getenv('REDIS_HOST', 'redis')}:{os.getenv('REDIS_PORT', 6379)}/1",
+    }
+}
+
+# Read replicas: how long a user reads from the primary after a write, the
+# replica lag above which a replica is skipped, and how often that is checked
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+REPLICA_MAX_LAG_SECONDS = config('REPLICA_MAX_LAG_SECONDS', default=2.0, cast=float)
+REPLICA_HEALTH_INTERVAL = config('REPLICA_HEALTH_INTERVAL', default=5.0, cast=float)
+
+# Live stream directory page cache lifetime in seconds
+LIVE_DIRECTORY_CACHE_TTL = config('LIVE_DIRECTORY_CACHE_TTL', default=30, cast=int)
+
+# Prometheus text metrics at /metrics/. Celery task and email timings are
+# aggregated in Redis so the web process can serve them; an empty
+# METRICS_REDIS_URL keeps them in the observing process. With
+# METRICS_AUTH_TOKEN set, scrapes need "Authorization: Bearer <token>".
+METRICS_REDIS_URL = config('METRICS_REDIS_URL', default=PRESENCE_REDIS_URL)
+METRICS_AUTH_TOKEN = config('METRICS_AUTH_TOKEN', default='')
+
+# Per-request / task / WebSocket handler SQL query budgets, keyed by URL name,
+# 'task:<task name>' or 'ws:<handler>'. Strict mode raises QueryBudgetExceeded;
+# the test suite runs every route with it on, and fails routes without a budget.
+QUERY_BUDGET_STRICT = config('QUERY_BUDGET_STRICT', default=False, cast=bool)
+QUERY_BUDGET_DEFAULT = None
+QUERY_COUNT_HEADERS = config('QUERY_COUNT_HEADERS', default=DEBUG, cast=bool)
+QUERY_BUDGETS = {
+    'api-root': 1,
+    'metrics': 0,
+    'register_user': 3,
+    'login_user': 9,
+    'logout_user': 7,
+    'user-register': 3,
+    'user-list': 2,
+    'stream-list': 2,
+    'stream-all-streams': 2,
+    'stream-live': 2,
+    'stream-start': 3,
+    'stream-stop': 3,
+    'stream-viewers': 2,
+    'stream-donation-stats': 4,
+    # The async create views cost 2 queries fewer once the token is cached
+    'create_donation': 6,
+    'confirm_donation': 12,
+    'stream_donations': 3,
+    'donation-list': 5,
+    # Editing or deleting a completed donation adjusts and republishes its
+    # stream's aggregates; moving one to another stream is the worst case
+    'donation-detail': 17,
+    'donation-confirm': 12,
+    'create_comment': 4,
+    'stream_comments': 2,
+    'comment-list': 3,
+    'comment-detail': 4,
+    # Deletes cascade with one query per related model
+    'user-detail': 19,
+    'stream-detail': 10,
+    # A batch of one stream and donor; every further stream or (stream, donor)
+    # pair adds an UPDATE, and every RECONCILE_CHUNK_SIZE items two queries
+    'donation-batch-confirm': 10,
+    # The outbox relay and the email flush scale with the batches they
+    # process and have no fixed budget
+    'ws:connect': 0,
+    'ws:receive': 2,
+    'ws:disconnect': 0,
+    'task:DjangoLiveStreaming.tasks.process_donation': 9,
+    'task:DjangoLiveStreaming.tasks.send_donation_notification_email': 3,
+    'task:DjangoLiveStreaming.tasks.purge_outbox_events': 2,
+}
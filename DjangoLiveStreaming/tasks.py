@@ -1,41 +1,57 @@
-import os
+from datetime import timedelta
 from celery import shared_task
-from django.core.mail import EmailMessage
-from django.template.loader import render_to_string
-from .models import Donation
+from django.conf import settings
+from django.db import OperationalError
+from .broadcast import broadcast_to_stream
+from .donations import PENDING_ONLY, complete_donation, sweep_pending_donations
+from .emails import flush_email_queue, pending_batch_ready, queue_donation_notification
+from .outbox import purge_dispatched, relay_outbox
 
 
-@shared_task
+# The transition is a conditional UPDATE, so a retried or duplicated task is a
+# no-op, and a late one can't override a failure the provider already reported
+@shared_task(autoretry_for=(OperationalError,), retry_backoff=True, max_retries=5)
 def process_donation(donation_id):
-    donation = Donation.objects.get(id=donation_id)
-    donation.status = 'completed'
-    donation.save()
-    send_donation_notification_email.delay(donation.id)
+    complete_donation(donation_id, PENDING_ONLY)
+
+
+@shared_task
+def sweep_pending_donations_task():
+    return sweep_pending_donations(
+        timedelta(seconds=settings.DONATION_SWEEP_AGE),
+        settings.DONATION_SWEEP_BATCH_SIZE
+    )
 
 
 @shared_task
 def send_donation_notification_email(donation_id):
-    donation = Donation.objects.get(id=donation_id)
+    queue_donation_notification(donation_id)
+    if pending_batch_ready():
+        flush_email_queue_task.delay()
 
-    # Email to the streamer
-    subject_streamer = f'New Donation - Rp {donation.amount}'
-    from_email = f"{os.getenv('MAIL_FROM_NAME')} <{os.getenv('MAIL_FROM_EMAIL')}>"
-    recipient_list_streamer = [donation.stream.streamer.email]
 
-    # Render the HTML message for the streamer
-    html_message_streamer = render_to_string('emails/donation_received_streamer.html', {'donation': donation})
+@shared_task
+def flush_email_queue_task():
+    return flush_email_queue()
 
-    email_streamer = EmailMessage(subject_streamer, html_message_streamer, from_email, recipient_list_streamer)
-    email_streamer.content_subtype = 'html'
-    email_streamer.send(fail_silently=False)
 
-    # Email to the donor
-    subject_donor = f'Thank You for Your Donation - Rp {donation.amount}'
-    recipient_list_donor = [donation.donor.email]
+OUTBOX_HANDLERS = {
+    'process_donation': lambda payload: process_donation.delay(payload['donation_id']),
+    'donation_email': lambda payload: queue_donation_notification(payload['donation_id']),
+    'stream_message': lambda payload: broadcast_to_stream(
+        payload['stream_id'], payload['message'], payload.get('kind', 'chat')
+    ),
+}
 
-    # Render the HTML message for the donor
-    html_message_donor = render_to_string('emails/donation_received_donor.html', {'donation': donation})
 
-    email_donor = EmailMessage(subject_donor, html_message_donor, from_email, recipient_list_donor)
-    email_donor.content_subtype = 'html'
-    email_donor.send(fail_silently=False)
+@shared_task
+def relay_outbox_events():
+    dispatched = relay_outbox(OUTBOX_HANDLERS, batch_size=settings.OUTBOX_RELAY_BATCH_SIZE)
+    if dispatched and pending_batch_ready():
+        flush_email_queue_task.delay()
+    return dispatched
+
+
+@shared_task
+def purge_outbox_events():
+    return purge_dispatched(timedelta(hours=settings.OUTBOX_RETENTION_HOURS))
@@ -0,0 +1,618 @@
+# DjangoLiveStreaming/tests.py
+import asyncio
+import itertools
+import json
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocmemEmailBackend
+from django.contrib.auth import get_user_model
+from django.db.models import Count
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import fanout, metrics, outbox
+from .batching import batch_window
+from .donation_stats import get_donation_stats, rebuild_donation_stats
+from .donations import complete_donation
+from .emails import flush_email_queue, queue_donation_notification
+from .comment_pipeline import CommentPipeline
+from .tasks import OUTBOX_HANDLERS
+from .fast_serializers import comment_reader, donation_reader, stream_reader
+from .history import MemoryHistoryBackend, stream_history
+from .models import Comment, Donation, OutboxEvent, QueuedEmail, Stream
+from .presence import MemoryPresenceBackend, presence
+from .renderers import FastJSONRenderer
+from .token_cache import authenticate_token, token_user_cache, validate_access_token
+from .serializers import CommentSerializer, DonationSerializer, StreamSerializer
+from .views import get_tokens_for_user
+
+User = get_user_model()
+
+# Settings that keep the suite off Redis and Celery
+LOCAL_SERVICES = dict(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    METRICS_REDIS_URL='',
+)
+
+
+def route_names(patterns=None):
+    """Names of the project's URL patterns, leaving out namespaced apps such as the admin."""
+    names = set()
+    for pattern in patterns if patterns is not None else get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace is None:
+                names |= route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def detail(name, key, **kwargs):
+    return lambda fx: reverse(name, kwargs={'pk': getattr(fx, key).pk, **kwargs})
+
+
+# (url name, method, url, body, user, expected status). ``url`` and
+# ``body`` take the fixtures; every case gets fresh ones.
+ROUTE_CASES = [
+    ('api-root', 'get', lambda fx: reverse('api-root'), None, 'viewer', 200),
+    ('metrics', 'get', lambda fx: reverse('metrics'), None, None, 200),
+    ('register_user', 'post', lambda fx: reverse('register_user'),
+     lambda fx: {'username': f'new{fx.n}', 'email': f'new{fx.n}@example.com', 'password': 'secret-pw'}, None, 200),
+    ('login_user', 'post', lambda fx: reverse('login_user'),
+     lambda fx: {'username': fx.viewer.username, 'password': 'secret-pw'}, None, 200),
+    ('logout_user', 'post', lambda fx: reverse('logout_user'),
+     lambda fx: {'refresh_token': fx.refresh}, 'viewer', 200),
+    ('user-register', 'post', lambda fx: reverse('user-register'),
+     lambda fx: {'username': f'new{fx.n}', 'email': f'new{fx.n}@example.com', 'password': 'secret-pw'}, None, 201),
+    ('user-list', 'get', lambda fx: reverse('user-list'), None, 'viewer', 200),
+    ('user-list', 'post', lambda fx: reverse('user-list'),
+     lambda fx: {'username': f'new{fx.n}', 'email': f'new{fx.n}@example.com', 'password': 'secret-pw'}, None, 201),
+    ('user-detail', 'get', detail('user-detail', 'viewer'), None, 'viewer', 200),
+    ('user-detail', 'put', detail('user-detail', 'viewer'),
+     lambda fx: {'username': fx.viewer.username, 'email': f'moved{fx.n}@example.com', 'password': 'secret-pw'},
+     'viewer', 200),
+    ('user-detail', 'patch', detail('user-detail', 'viewer'),
+     lambda fx: {'email': f'moved{fx.n}@example.com'}, 'viewer', 200),
+    ('user-detail', 'delete', detail('user-detail', 'streamer'), None, 'streamer', 204),
+    ('stream-list', 'get', lambda fx: reverse('stream-list'), None, 'viewer', 200),
+    ('stream-list', 'post', lambda fx: reverse('stream-list'),
+     lambda fx: {'title': 'Another', 'description': 'More'}, 'streamer', 201),
+    ('stream-all-streams', 'get', lambda fx: reverse('stream-all-streams'), None, 'viewer', 200),
+    ('stream-live', 'get', lambda fx: reverse('stream-live'), None, 'viewer', 200),
+    ('stream-detail', 'get', detail('stream-detail', 'stream'), None, 'viewer', 200),
+    ('stream-detail', 'put', detail('stream-detail', 'stream'),
+     lambda fx: {'title': 'Renamed', 'description': 'Still live'}, 'streamer', 200),
+    ('stream-detail', 'patch', detail('stream-detail', 'stream'), lambda fx: {'title': 'Renamed'}, 'streamer', 200),
+    ('stream-detail', 'delete', detail('stream-detail', 'stream'), None, 'streamer', 204),
+    ('stream-donation-stats', 'get', detail('stream-donation-stats', 'stream'), None, 'viewer', 200),
+    ('stream-start', 'post', detail('stream-start', 'stream'), None, 'streamer', 200),
+    ('stream-stop', 'post', detail('stream-stop', 'stream'), None, 'streamer', 200),
+    ('stream-viewers', 'get', detail('stream-viewers', 'stream'), None, 'viewer', 200),
+    # The explicit donation and comment paths in urls.py shadow these router
+    # routes, which stay reachable through the format suffix
+    ('donation-list', 'get', lambda fx: reverse('donation-list', kwargs={'format': 'json'}), None, 'viewer', 200),
+    ('donation-list', 'post', lambda fx: reverse('donation-list', kwargs={'format': 'json'}),
+     lambda fx: {'amount': '10.00', 'message': 'Hi', 'stream': fx.stream.pk, 'payment_method': 'bank_transfer'},
+     'viewer', 201),
+    ('donation-batch-confirm', 'post', lambda fx: reverse('donation-batch-confirm'),
+     lambda fx: {'donations': [{'transaction_id': str(fx.donation.transaction_id), 'status': 'completed'}]},
+     'admin', 200),
+    ('donation-detail', 'get', detail('donation-detail', 'donation'), None, 'viewer', 200),
+    ('donation-detail', 'put', detail('donation-detail', 'donation'),
+     lambda fx: {'amount': '10.00', 'message': 'Edited', 'stream': fx.stream.pk, 'payment_method': 'bank_transfer'},
+     'viewer', 200),
+    ('donation-detail', 'patch', detail('donation-detail', 'donation'), lambda fx: {'message': 'Edited'}, 'viewer', 200),
+    ('donation-detail', 'delete', detail('donation-detail', 'donation'), None, 'viewer', 204),
+    ('donation-confirm', 'post', detail('donation-confirm', 'donation', format='json'), None, 'streamer', 200),
+    ('confirm_donation', 'post', detail('confirm_donation', 'donation'), None, 'streamer', 200),
+    ('stream_donations', 'get', lambda fx: f"{reverse('stream_donations')}?stream={fx.stream.pk}", None, 'viewer', 200),
+    ('create_donation', 'post', lambda fx: reverse('create_donation'),
+     lambda fx: {'amount': '10.00', 'message': 'Hi', 'stream': fx.stream.pk, 'payment_method': 'bank_transfer'},
+     'viewer', 201),
+    ('create_comment', 'post', lambda fx: reverse('create_comment'),
+     lambda fx: {'content': 'Hello', 'stream': fx.stream.pk}, 'viewer', 201),
+    ('comment-list', 'get', lambda fx: reverse('comment-list'), None, 'viewer', 200),
+    ('comment-list', 'post', lambda fx: reverse('comment-list'),
+     lambda fx: {'content': 'Hello', 'stream': fx.stream.pk}, 'viewer', 201),
+    ('comment-detail', 'get', detail('comment-detail', 'comment', format='json'), None, 'viewer', 200),
+    ('comment-detail', 'put', detail('comment-detail', 'comment', format='json'),
+     lambda fx: {'content': 'Edited', 'stream': fx.stream.pk}, 'viewer', 200),
+    ('comment-detail', 'patch', detail('comment-detail', 'comment', format='json'), lambda fx: {'content': 'Edited'}, 'viewer', 200),
+    ('comment-detail', 'delete', detail('comment-detail', 'comment', format='json'), None, 'viewer', 204),
+    ('stream_comments', 'get', detail('stream_comments', 'stream'), None, 'viewer', 200),
+]
+
+
+@override_settings(QUERY_BUDGET_STRICT=True, **LOCAL_SERVICES)
+class QueryBudgetTests(TransactionTestCase):
+    """
+    Every named route has a QUERY_BUDGETS entry and stays within it. The
+    requests run with QUERY_BUDGET_STRICT, so QueryCountMiddleware raises
+    on the first one over budget. A TransactionTestCase, so atomic blocks
+    cost what they do in production rather than savepoints.
+    """
+
+    counter = itertools.count()
+
+    def setUp(self):
+        patches = [
+            mock.patch.object(presence, 'backend', MemoryPresenceBackend()),
+            mock.patch.object(stream_history, 'backend', MemoryHistoryBackend(settings.STREAM_HISTORY_SIZE)),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def make_fixtures(self):
+        n = next(self.counter)
+        viewer = User.objects.create_user(f'viewer{n}', f'viewer{n}@example.com', 'secret-pw')
+        streamer = User.objects.create_user(f'streamer{n}', f'streamer{n}@example.com', 'secret-pw', is_streamer=True)
+        admin = User.objects.create_user(f'admin{n}', f'admin{n}@example.com', 'secret-pw', is_staff=True)
+        stream = Stream.objects.create(title='Live', description='Now', streamer=streamer)
+        donation = Donation.objects.create(
+            stream=stream, donor=viewer, amount='10.00', message='Hi', payment_method='bank_transfer'
+        )
+        comment = Comment.objects.create(stream=stream, user=viewer, content='Hello')
+        tokens = {user: get_tokens_for_user(user) for user in (viewer, streamer, admin)}
+        return SimpleNamespace(
+            n=n, viewer=viewer, streamer=streamer, admin=admin, stream=stream, donation=donation,
+            comment=comment, tokens=tokens, refresh=tokens[viewer]['refresh_token']
+        )
+
+    def test_every_route_has_a_budget(self):
+        missing = sorted(name for name in route_names() if name not in settings.QUERY_BUDGETS)
+        self.assertEqual(missing, [], "Routes without a QUERY_BUDGETS entry")
+
+    def test_every_route_has_a_case(self):
+        covered = {case[0] for case in ROUTE_CASES}
+        self.assertEqual(sorted(route_names() - covered), [], "Routes without a case in ROUTE_CASES")
+
+    def test_routes_stay_within_budget(self):
+        for name, method, url, body, user, expected in ROUTE_CASES:
+            with self.subTest(route=name, method=method):
+                fx = self.make_fixtures()
+                headers = {}
+                if user:
+                    headers['HTTP_AUTHORIZATION'] = f"Bearer {fx.tokens[getattr(fx, user)]['access_token']}"
+                if body:
+                    headers.update(data=json.dumps(body(fx)), content_type='application/json')
+                response = getattr(self.client, method)(url(fx), **headers)
+                self.assertEqual(response.resolver_match.url_name, name)
+                self.assertEqual(response.status_code, expected, response.content[:300])
+
+
+@override_settings(**LOCAL_SERVICES)
+class KeysetCursorTests(TestCase):
+    def test_bad_cursor_is_a_400_envelope(self):
+        viewer = User.objects.create_user('viewer', 'viewer@example.com', 'secret-pw')
+        auth = f"Bearer {get_tokens_for_user(viewer)['access_token']}"
+        for name in ('comment-list', 'stream-live'):
+            with self.subTest(route=name):
+                response = self.client.get(f'{reverse(name)}?after=not-a-cursor', HTTP_AUTHORIZATION=auth)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'code': 400, 'message': 'Invalid cursor.', 'data': None})
+
+class FastSerializerTests(TestCase):
+    """
+    FastReader + FastJSONRenderer must render the same bytes as the
+    ModelSerializer + JSONRenderer path they replace.
+    """
+
+    texts = ['plain', 'ünïcödé ✓ 日本語 🎉', 'line\u2028separator\u2029paragraph', 'quote " back\\slash', '']
+
+    @classmethod
+    def setUpTestData(cls):
+        streamer = User.objects.create_user('streamer', 'streamer@example.com', 'secret-pw', is_streamer=True)
+        viewer = User.objects.create_user('viewer', 'viewer@example.com', 'secret-pw')
+        for i, text in enumerate(cls.texts):
+            stream = Stream.objects.create(title=text or 'untitled', description=text, streamer=streamer)
+            Donation.objects.create(
+                stream=stream, donor=viewer, amount=['0.50', '12345.67', '10', '0.01', '99999999.99'][i],
+                message=text, payment_method='bank_transfer', transaction_id=uuid.uuid4()
+            )
+            Comment.objects.create(stream=stream, user=viewer, content=text)
+        # Microseconds, a whole second and a pre-epoch value
+        moments = [
+            datetime(2024, 2, 29, 23, 59, 59, 123456, tzinfo=dt_timezone.utc),
+            datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+            datetime(1969, 12, 31, 12, 0, 0, 1, tzinfo=dt_timezone.utc),
+        ]
+        for model in (Stream, Donation, Comment):
+            for obj, moment in zip(model.objects.order_by('id'), itertools.cycle(moments)):
+                model.objects.filter(pk=obj.pk).update(created_at=moment, updated_at=moment)
+
+    def assert_same_output(self, queryset, serializer_class, reader):
+        queryset = queryset.order_by('id')
+        current = JSONRenderer().render({'code': 200, 'message': 'ok', 'data': serializer_class(queryset, many=True).data})
+        fast = FastJSONRenderer().render({'code': 200, 'message': 'ok', 'data': reader.read(queryset)})
+        self.assertEqual(fast, current)
+
+    def test_readers_match_model_serializers(self):
+        cases = [
+            (Stream.objects.all(), StreamSerializer, stream_reader),
+            (Donation.objects.all(), DonationSerializer, donation_reader),
+            (Comment.objects.all(), CommentSerializer, comment_reader),
+        ]
+        for time_zone in ('UTC', 'Asia/Jakarta', 'America/St_Johns'):
+            for queryset, serializer_class, reader in cases:
+                with self.subTest(serializer=serializer_class.__name__, time_zone=time_zone), \
+                        override_settings(TIME_ZONE=time_zone):
+                    self.assert_same_output(queryset, serializer_class, reader)
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'text': self.texts,
+            'amount': Decimal('12345.670'),
+            'id': uuid.UUID('12345678-1234-5678-1234-567812345678'),
+            'at': datetime(2024, 2, 29, 23, 59, 59, 123456, tzinfo=dt_timezone.utc),
+            'nested': [{'n': None, 'flag': True, 'float': 1.5}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class FlakyLayer:
+    """Channel layer whose first ``failures`` receives raise, then yields ``events``."""
+
+    def __init__(self, failures, events, join_gate=None):
+        self.failures = failures
+        self.events = list(events)
+        self.join_gate = join_gate
+        self.group_adds = 0
+        self.group_discards = 0
+
+    async def new_channel(self, prefix):
+        return f'{prefix}test'
+
+    async def group_add(self, group, channel):
+        if self.join_gate is not None:
+            await self.join_gate.wait()
+        self.group_adds += 1
+
+    async def group_discard(self, group, channel):
+        self.group_discards += 1
+
+    async def receive(self, channel):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError('layer unreachable')
+        if self.events:
+            return self.events.pop(0)
+        await asyncio.Event().wait()
+
+
+class RecordingConsumer:
+    def __init__(self, channel_layer=None):
+        self.channel_layer = channel_layer
+        self.events = []
+
+    async def stream_message(self, event):
+        self.events.append(event)
+
+
+class BatchWindowTests(SimpleTestCase):
+    @override_settings(STREAM_BATCH_WINDOW_MS=0, STREAM_BATCH_WINDOWS={7: 50})
+    def test_only_listed_streams_batch(self):
+        self.assertEqual(batch_window(7), 0.05)
+        self.assertEqual(batch_window(8), 0)
+
+    @override_settings(STREAM_BATCH_WINDOW_MS=20, STREAM_BATCH_WINDOWS={7: 0})
+    def test_a_stream_can_opt_out(self):
+        self.assertEqual(batch_window(7), 0)
+        self.assertEqual(batch_window(8), 0.02)
+
+
+@mock.patch.object(fanout, 'RETRY_INITIAL_DELAY', 0)
+class StreamRelayTests(SimpleTestCase):
+    async def test_relay_survives_receive_errors(self):
+        layer = FlakyLayer(failures=2, events=[{'type': 'stream_message', 'kind': 'chat', 'text': '{}'}])
+        consumer = RecordingConsumer()
+        relay = fanout.StreamRelay(1, layer)
+        relay.consumers.add(consumer)
+        with self.assertLogs('DjangoLiveStreaming.fanout', 'WARNING') as logs:
+            await relay.start()
+            for _ in range(20):
+                if consumer.events:
+                    break
+                await asyncio.sleep(0.01)
+            await relay.stop()
+        self.assertEqual(len(consumer.events), 1)
+        self.assertEqual(len(logs.records), 2)
+        # Joined on start, then again before each retry
+        self.assertEqual(layer.group_adds, 3)
+
+    async def test_last_viewer_leaving_during_start(self):
+        gate = asyncio.Event()
+        layer = FlakyLayer(failures=0, events=[], join_gate=gate)
+        consumer = RecordingConsumer(layer)
+        local = fanout.LocalFanout()
+        subscribing = asyncio.ensure_future(local.subscribe(1, consumer))
+        await asyncio.sleep(0)
+
+        await local.unsubscribe(1, consumer)
+        gate.set()
+        await subscribing
+        self.assertEqual(local.relays, {})
+        self.assertEqual((layer.group_adds, layer.group_discards), (1, 1))
+
+    @override_settings(STREAM_RELAY_REFRESH_INTERVAL=0.01)
+    async def test_relay_refreshes_its_group(self):
+        layer = FlakyLayer(failures=0, events=[])
+        relay = fanout.StreamRelay(1, layer)
+        await relay.start()
+        await asyncio.sleep(0.05)
+        await relay.stop()
+        self.assertGreater(layer.group_adds, 1)
+
+
+@override_settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BACKOFF=5)
+class OutboxRelayTests(TestCase):
+    def failing(self, payload):
+        raise ConnectionError('broker unreachable')
+
+    def test_failing_event_backs_off_then_fails(self):
+        good = outbox.enqueue('good')
+        bad = outbox.enqueue('bad')
+        handlers = {'good': lambda payload: None, 'bad': self.failing}
+
+        with self.assertLogs('DjangoLiveStreaming.outbox', 'ERROR'):
+            self.assertEqual(outbox.relay_outbox(handlers), 1)
+        bad.refresh_from_db()
+        self.assertEqual(bad.attempts, 1)
+        self.assertIsNone(bad.failed_at)
+        self.assertGreater(bad.next_attempt_at, timezone.now())
+        self.assertIsNotNone(OutboxEvent.objects.get(pk=good.pk).dispatched_at)
+
+        # Not due yet
+        self.assertEqual(outbox.relay_outbox(handlers), 0)
+        self.assertEqual(OutboxEvent.objects.get(pk=bad.pk).attempts, 1)
+
+        OutboxEvent.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        with self.assertLogs('DjangoLiveStreaming.outbox', 'ERROR'):
+            outbox.relay_outbox(handlers)
+        bad.refresh_from_db()
+        self.assertEqual(bad.attempts, 2)
+        self.assertIsNotNone(bad.failed_at)
+        self.assertIn('broker unreachable', bad.last_error)
+
+        # A failed event is never picked up again
+        OutboxEvent.objects.filter(pk=bad.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(outbox.claim_events(10), [])
+
+    def test_repeated_email_event_queues_each_email_once(self):
+        streamer = User.objects.create_user('streamer', 'streamer@example.com', 'secret-pw', is_streamer=True)
+        viewer = User.objects.create_user('viewer', 'viewer@example.com', 'secret-pw')
+        stream = Stream.objects.create(title='Live', description='Now', streamer=streamer)
+        donation = Donation.objects.create(
+            stream=stream, donor=viewer, amount='10.00', message='Hi', payment_method='bank_transfer'
+        )
+        # As if the lease ran out, or the relay crashed before marking it dispatched
+        OUTBOX_HANDLERS['donation_email']({'donation_id': donation.pk})
+        OUTBOX_HANDLERS['donation_email']({'donation_id': donation.pk})
+        self.assertEqual(
+            sorted(QueuedEmail.objects.values_list('recipient_role', flat=True)), ['donor', 'streamer']
+        )
+
+
+class CommentPipelineTests(TestCase):
+    def test_comments_keep_their_submit_time(self):
+        streamer = User.objects.create_user('streamer', 'streamer@example.com', 'secret-pw', is_streamer=True)
+        stream = Stream.objects.create(title='live', description='', streamer=streamer)
+        pipeline = CommentPipeline(batch_size=100, flush_interval=60, max_buffer=100)
+        self.addCleanup(pipeline.shutdown)
+
+        submitted = datetime(2024, 5, 1, 12, 0, 0, 250000, tzinfo=dt_timezone.utc)
+        with mock.patch('django.utils.timezone.now', return_value=submitted):
+            pipeline.submit(stream.pk, streamer.pk, 'first')
+            asyncio.run(pipeline.asubmit(stream.pk, streamer.pk, 'second'))
+        pipeline.flush()
+
+        self.assertEqual(
+            list(Comment.objects.order_by('id').values_list('content', 'created_at', 'updated_at')),
+            [('first', submitted, submitted), ('second', submitted, submitted)]
+        )
+        self.assertEqual(pipeline.stats, {'accepted': 2, 'persisted': 2, 'dropped': 0, 'flushes': 1})
+
+    def test_missing_stream_does_not_fail_the_batch(self):
+        streamer = User.objects.create_user('streamer', 'streamer@example.com', 'secret-pw', is_streamer=True)
+        stream = Stream.objects.create(title='live', description='', streamer=streamer)
+        pipeline = CommentPipeline(batch_size=100, flush_interval=60, max_buffer=100)
+        self.addCleanup(pipeline.shutdown)
+
+        pipeline.submit(stream.pk, streamer.pk, 'kept')
+        pipeline.submit(stream.pk + 1000, streamer.pk, 'no such stream')
+        pipeline.submit(stream.pk, streamer.pk, 'also kept')
+        with self.assertNoLogs('DjangoLiveStreaming.comment_pipeline'):
+            pipeline.flush()
+
+        self.assertEqual(list(Comment.objects.order_by('id').values_list('content', flat=True)), ['kept', 'also kept'])
+        self.assertEqual(pipeline.stats, {'accepted': 3, 'persisted': 2, 'dropped': 1, 'flushes': 1})
+
+
+@override_settings(**LOCAL_SERVICES)
+class TokenRevocationTests(TestCase):
+    def logout(self, tokens):
+        return self.client.post(
+            reverse('logout_user'), data=json.dumps({'refresh_token': tokens['refresh_token']}),
+            content_type='application/json', HTTP_AUTHORIZATION=f"Bearer {tokens['access_token']}"
+        )
+
+    def test_logout_revokes_the_access_token(self):
+        viewer = User.objects.create_user('viewer', 'viewer@example.com', 'secret-pw')
+        tokens = get_tokens_for_user(viewer)
+        access = tokens['access_token']
+        self.assertEqual(async_to_sync(authenticate_token)(access, validate_access_token), viewer)
+
+        self.assertEqual(self.logout(tokens).status_code, 200)
+        self.assertEqual(token_user_cache.stats()['size'], 0)
+        self.assertIsNone(async_to_sync(authenticate_token)(access, validate_access_token))
+        self.assertIsNone(async_to_sync(authenticate_token)(access))
+
+    def test_logout_in_another_process_revokes_the_cached_token(self):
+        viewer = User.objects.create_user('viewer', 'viewer@example.com', 'secret-pw')
+        revoked, other_session = get_tokens_for_user(viewer), get_tokens_for_user(viewer)
+        for tokens in (revoked, other_session):
+            self.assertEqual(async_to_sync(authenticate_token)(tokens['access_token']), viewer)
+
+        # This process's entries survive; only the shared marker is written
+        with mock.patch.object(token_user_cache, 'invalidate_user'):
+            self.assertEqual(self.logout(revoked).status_code, 200)
+        self.assertIsNone(async_to_sync(authenticate_token)(revoked['access_token']))
+        self.assertEqual(async_to_sync(authenticate_token)(other_session['access_token']), viewer)
+
+
+class MetricsStoreTests(SimpleTestCase):
+    def test_scrape_survives_an_unreachable_store(self):
+        client = mock.Mock()
+        client.hgetall.side_effect = ConnectionError('metrics redis down')
+        errors = metrics.store_errors['errors']
+        with mock.patch.object(metrics.SharedHistogram, 'client', return_value=client):
+            body = metrics.registry.render()
+        self.assertIn('livestreaming_celery_task_duration_seconds', body)
+        self.assertGreater(metrics.store_errors['errors'], errors)
+
+
+class FlakyEmailBackend(LocmemEmailBackend):
+    """locmem backend that refuses some recipients, or to connect at all."""
+
+    refuse = set()
+    opens_left = None
+
+    def open(self):
+        if self.opens_left is not None:
+            if self.opens_left <= 0:
+                raise ConnectionRefusedError('smtp down')
+            FlakyEmailBackend.opens_left -= 1
+        return super().open()
+
+    def send_messages(self, messages):
+        for message in messages:
+            if self.refuse & set(message.to):
+                raise ConnectionResetError(f'refused {message.to}')
+        return super().send_messages(messages)
+
+
+@override_settings(
+    EMAIL_BACKEND='DjangoLiveStreaming.tests.FlakyEmailBackend', EMAIL_MAX_ATTEMPTS=2, EMAIL_RETRY_BACKOFF=30
+)
+class EmailQueueTests(TestCase):
+    def setUp(self):
+        self.streamer = User.objects.create_user('streamer', 'streamer@example.com', 'secret-pw', is_streamer=True)
+        stream = Stream.objects.create(title='Live', description='Now', streamer=self.streamer)
+        for i in range(3):
+            donor = User.objects.create_user(f'donor{i}', f'donor{i}@example.com', 'secret-pw')
+            donation = Donation.objects.create(
+                stream=stream, donor=donor, amount='10.00', message='Hi', payment_method='bank_transfer'
+            )
+            queue_donation_notification(donation.pk)
+        patches = [
+            mock.patch.object(FlakyEmailBackend, 'refuse', set()),
+            mock.patch.object(FlakyEmailBackend, 'opens_left', None),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def statuses(self):
+        return dict(QueuedEmail.objects.values_list('status').annotate(n=Count('id')).order_by())
+
+    def test_sends_in_batches(self):
+        self.assertEqual(flush_email_queue(batch_size=4)['sent'], 4)
+        self.assertEqual(flush_email_queue(batch_size=4)['sent'], 2)
+        self.assertEqual(flush_email_queue(batch_size=4)['sent'], 0)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertEqual(self.statuses(), {'sent': 6})
+
+    def test_a_failed_email_is_retried_without_stopping_the_batch(self):
+        FlakyEmailBackend.refuse = {'donor1@example.com'}
+        with self.assertLogs('DjangoLiveStreaming.emails', 'WARNING'):
+            result = flush_email_queue()
+        self.assertEqual((result['sent'], result['retried'], result['failed']), (5, 1, 0))
+        refused = QueuedEmail.objects.get(donation__donor__username='donor1', recipient_role='donor')
+        self.assertEqual((refused.status, refused.attempts), ('pending', 1))
+        self.assertGreater(refused.next_attempt_at, timezone.now())
+
+        # Due again, and still refused: out of attempts
+        QueuedEmail.objects.filter(pk=refused.pk).update(next_attempt_at=timezone.now())
+        with self.assertLogs('DjangoLiveStreaming.emails', 'WARNING'):
+            self.assertEqual(flush_email_queue()['failed'], 1)
+        self.assertEqual(self.statuses(), {'sent': 5, 'failed': 1})
+
+    def test_connection_failure_counts_an_attempt(self):
+        FlakyEmailBackend.opens_left = 0
+        with self.assertLogs('DjangoLiveStreaming.emails', 'WARNING'):
+            result = flush_email_queue()
+        self.assertEqual((result['sent'], result['retried']), (0, 6))
+        self.assertEqual(set(QueuedEmail.objects.values_list('attempts', flat=True)), {1})
+        self.assertEqual(mail.outbox, [])
+
+    def test_lost_connection_keeps_what_was_delivered(self):
+        # The first donor email fails and the reconnect is refused
+        FlakyEmailBackend.refuse = {'donor0@example.com'}
+        FlakyEmailBackend.opens_left = 1
+        with self.assertLogs('DjangoLiveStreaming.emails', 'WARNING'):
+            result = flush_email_queue()
+        delivered = len(mail.outbox)
+        self.assertGreater(delivered, 0)
+        self.assertEqual(result['sent'], delivered)
+        self.assertEqual(self.statuses(), {'sent': delivered, 'pending': 6 - delivered})
+        self.assertEqual(QueuedEmail.objects.filter(status='pending', attempts=1).count(), 6 - delivered)
+
+
+@override_settings(**LOCAL_SERVICES)
+class DonationStatsTests(TestCase):
+    def setUp(self):
+        self.streamer = User.objects.create_user('streamer', 'streamer@example.com', 'secret-pw', is_streamer=True)
+        self.donor = User.objects.create_user('donor', 'donor@example.com', 'secret-pw')
+        self.streams = [
+            Stream.objects.create(title=title, description='', streamer=self.streamer) for title in ('one', 'two')
+        ]
+        self.donations = []
+        for amount in ('10.00', '25.00'):
+            donation = Donation.objects.create(
+                stream=self.streams[0], donor=self.donor, amount=amount, message='Hi', payment_method='bank_transfer'
+            )
+            complete_donation(donation.pk)
+            self.donations.append(donation)
+        self.auth = f"Bearer {get_tokens_for_user(self.donor)['access_token']}"
+
+    def stats(self):
+        return [get_donation_stats(stream.pk) for stream in self.streams]
+
+    def assert_matches_rebuild(self):
+        current = self.stats()
+        rebuild_donation_stats()
+        self.assertEqual(current, self.stats())
+        return current
+
+    def send(self, method, donation, body=None):
+        kwargs = {'HTTP_AUTHORIZATION': self.auth}
+        if body is not None:
+            kwargs.update(data=json.dumps(body), content_type='application/json')
+        url = reverse('donation-detail', kwargs={'pk': donation.pk})
+        return getattr(self.client, method)(url, **kwargs)
+
+    def test_editing_a_completed_donation_moves_its_totals(self):
+        self.assertEqual(self.send('patch', self.donations[0], {'amount': '15.00'}).status_code, 200)
+        one, _ = self.assert_matches_rebuild()
+        self.assertEqual((one['total_amount'], one['donation_count']), ('40.00', 2))
+
+        self.assertEqual(self.send('patch', self.donations[1], {'stream': self.streams[1].pk}).status_code, 200)
+        one, two = self.assert_matches_rebuild()
+        self.assertEqual((one['total_amount'], two['total_amount']), ('15.00', '25.00'))
+        self.assertEqual(Donation.objects.get(pk=self.donations[1].pk).status, 'completed')
+
+    def test_deleting_a_completed_donation_takes_it_out(self):
+        for donation in self.donations:
+            self.assertEqual(self.send('delete', donation).status_code, 204)
+        one, _ = self.assert_matches_rebuild()
+        self.assertEqual((one['total_amount'], one['donation_count'], one['top_donors']), ('0.00', 0, []))
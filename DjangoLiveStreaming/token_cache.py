@@ -0,0 +1,135 @@
+# DjangoLiveStreaming/token_cache.py
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import UntypedToken
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+# Access-token claim naming the refresh token it was issued from. simplejwt
+# only blacklists refresh tokens, so this is what logout revokes.
+REFRESH_JTI_CLAIM = 'refresh_jti'
+
+
+class TokenUserCache:
+    """
+    Bounded LRU of verified token jti -> user, shared by the WebSocket
+    handshake and the in-band 'authenticate' message. Entries expire after
+    ``ttl`` seconds or when the token itself expires, whichever is first.
+    The cache is per process; ``revoke_user`` tells the other processes
+    through the Django cache.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, jti):
+        """``(user, cached_at)`` for a live entry, else None."""
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[jti]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(jti)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def set(self, jti, user, token_exp):
+        now = time.time()
+        expires_at = min(now + self.ttl, token_exp)
+        with self._lock:
+            self._entries[jti] = (expires_at, user, now)
+            self._entries.move_to_end(jti)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            stale = [jti for jti, (_, user, _) in self._entries.items() if str(user.pk) == str(user_id)]
+            for jti in stale:
+                del self._entries[jti]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+token_user_cache = TokenUserCache(settings.WS_AUTH_CACHE_SIZE, settings.WS_AUTH_CACHE_TTL)
+
+
+def _revoked_key(user_id):
+    return f'ws_auth:revoked:{user_id}'
+
+
+def revoke_user(user_id):
+    """
+    Make every process re-check this user's cached tokens against the
+    blacklist. The marker outlives any entry cached before it.
+    """
+    token_user_cache.invalidate_user(user_id)
+    cache.set(_revoked_key(user_id), time.time(), settings.WS_AUTH_CACHE_TTL)
+
+
+def issue_access_token(refresh):
+    access = refresh.access_token
+    access[REFRESH_JTI_CLAIM] = refresh[settings.SIMPLE_JWT.get('JTI_CLAIM', 'jti')]
+    return access
+
+
+@database_sync_to_async
+def load_token_user(validated):
+    # Refresh tokens are blacklisted by their own jti, access tokens by the
+    # refresh token they came from; older access tokens lack that claim
+    jtis = [validated.get(settings.SIMPLE_JWT.get('JTI_CLAIM', 'jti'))]
+    if validated.get(REFRESH_JTI_CLAIM):
+        jtis.append(validated[REFRESH_JTI_CLAIM])
+    if BlacklistedToken.objects.filter(token__jti__in=jtis).exists():
+        return None
+    try:
+        user = User.objects.get(id=validated['user_id'])
+    except User.DoesNotExist:
+        return None
+    return user if user.is_active else None
+
+
+def validate_access_token(token):
+    # AUTH_TOKEN_CLASSES, as the DRF views check them; refresh tokens fail
+    return JWTAuthentication().get_validated_token(token)
+
+
+async def authenticate_token(token, validate=UntypedToken):
+    try:
+        validated = validate(token)
+    except (InvalidToken, TokenError) as e:
+        logger.debug(f"Invalid token: {e}")
+        return None
+
+    jti = validated.get(settings.SIMPLE_JWT.get('JTI_CLAIM', 'jti'))
+    cached = token_user_cache.get(jti)
+    user = None
+    if cached is not None:
+        user, cached_at = cached
+        revoked_at = await cache.aget(_revoked_key(user.pk))
+        if revoked_at is not None and revoked_at >= cached_at:
+            user = None
+    if user is None:
+        user = await load_token_user(validated)
+        if user is not None:
+            token_user_cache.set(jti, user, validated['exp'])
+    return user
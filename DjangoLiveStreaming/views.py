@@ -1,21 +1,40 @@
+import functools
+import hmac
+import json
 import uuid
 from rest_framework import viewsets, permissions, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.exceptions import NotAuthenticated
 from django.core.exceptions import ValidationError
 from rest_framework.exceptions import ValidationError as DRFValidationError
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.http import HttpResponse
+from channels.db import database_sync_to_async
 from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework_simplejwt.exceptions import InvalidToken
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
-from .tasks import process_donation, send_donation_notification_email
-
+from .broadcast import abroadcast_to_stream, broadcast_to_stream
+from .comment_pipeline import comment_pipeline
+from .db_router import ReplicaReadMixin, apin_user
 from .models import Stream, Donation, Comment
-from .serializers import UserSerializer, StreamSerializer, DonationSerializer, CommentSerializer
+from .serializers import UserSerializer, StreamSerializer, DonationSerializer, CommentSerializer, DonationBatchConfirmSerializer
+from .donation_stats import adjust_donation_totals, get_donation_stats
+from .donations import complete_donation, reconcile_donations
 from .dtos import ResponseDTO
+from .fast_serializers import comment_reader, donation_reader, stream_reader
+from .live_directory import get_live_page, invalidate_live_directory
+from . import metrics as metrics_registry
+from . import outbox
+from .pagination import InvalidCursor, paginate_keyset, wants_keyset
+from .presence import presence
+from .renderers import FastJSONRenderer
+from .token_cache import authenticate_token, issue_access_token, revoke_user, validate_access_token
 import logging
 
 
@@ -23,7 +42,28 @@ logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
-class UserViewSet(viewsets.ModelViewSet):
+
+def invalid_cursor_response():
+    return Response(ResponseDTO(code=400, message="Invalid cursor.", data=None).__dict__, status=400)
+
+
+def keyset_response(reader, queryset, request, message):
+    try:
+        rows, next_cursor = paginate_keyset(queryset, request, reader)
+    except InvalidCursor:
+        return invalid_cursor_response()
+    response_data = {
+        'code': status.HTTP_200_OK,
+        'message': message,
+        'data': {
+            'results': rows,
+            'next': next_cursor
+        }
+    }
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+class UserViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [permissions.AllowAny]
@@ -48,7 +88,7 @@ def get_tokens_for_user(user):
     refresh = RefreshToken.for_user(user)
     return {
         'refresh_token': str(refresh),
-        'access_token': str(refresh.access_token),
+        'access_token': str(issue_access_token(refresh)),
     }
 
 
@@ -59,14 +99,15 @@ def register_user(request):
     email = request.data.get('email')
     password = request.data.get('password')
 
-    if User.objects.filter(username=username).exists():
+    # One probe for both uniqueness checks
+    taken = list(User.objects.filter(Q(username=username) | Q(email=email)).values_list('username', 'email')[:2])
+    if any(row[0] == username for row in taken):
         return Response(ResponseDTO(code=400, message="Username is already taken.", data=None).__dict__, status=400)
 
-    if User.objects.filter(email=email).exists():
+    if taken:
         return Response(ResponseDTO(code=400, message="Email is already registered.", data=None).__dict__, status=400)
 
-    user = User.objects.create_user(username=username, email=email, password=password)
-    user.save()
+    User.objects.create_user(username=username, email=email, password=password)
 
     return Response(
         ResponseDTO(code=200, message="User registered successfully.", data={"username": username, "email": email}).__dict__)
@@ -96,6 +137,7 @@ def logout_user(request):
 
         token = RefreshToken(refresh_token)
         token.blacklist()
+        revoke_user(token['user_id'])
 
         return Response({"code": 200, "message": "Logout successful"})
     except TokenError:
@@ -106,13 +148,25 @@ def logout_user(request):
         return Response({"code": 500, "message": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class StreamViewSet(viewsets.ModelViewSet):
+class StreamViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Stream.objects.all()
     serializer_class = StreamSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # 'live' stays on the primary: its page is cached for everyone, and a
+    # lagging replica would keep serving a stale one until the cache expires
+    replica_actions = ('list', 'retrieve', 'all_streams', 'viewers', 'donation_stats')
 
     def perform_create(self, serializer):
         serializer.save(streamer=self.request.user)
+        invalidate_live_directory()
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_live_directory()
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidate_live_directory()
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
@@ -135,20 +189,37 @@ class StreamViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def all_streams(self, request):
-        streams = Stream.objects.all()
-        serializer = self.get_serializer(streams, many=True)
         response_data = {
             'code': status.HTTP_200_OK,
             'message': 'Streams retrieved successfully',
-            'data': serializer.data
+            'data': stream_reader.read(Stream.objects.all())
         }
         return Response(response_data, status=status.HTTP_200_OK)
 
+    @action(detail=False, methods=['get'])
+    def live(self, request):
+        try:
+            data, etag = get_live_page(request)
+        except InvalidCursor:
+            return invalid_cursor_response()
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response_data = {
+            'code': status.HTTP_200_OK,
+            'message': 'Live streams retrieved successfully',
+            'data': data
+        }
+        return Response(response_data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
         stream = self.get_object()
         stream.is_active = True
         stream.save()
+        invalidate_live_directory()
+        # Unique viewers are counted per broadcast
+        presence.reset_unique(stream.id)
         response = ResponseDTO(code=200, message="Stream started", data=StreamSerializer(stream).data)
         return Response(response.__dict__)
 
@@ -157,43 +228,85 @@ class StreamViewSet(viewsets.ModelViewSet):
         stream = self.get_object()
         stream.is_active = False
         stream.save()
+        invalidate_live_directory()
         response = ResponseDTO(code=200, message="Stream stopped", data=StreamSerializer(stream).data)
         return Response(response.__dict__)
 
+    @action(detail=True, methods=['get'])
+    def viewers(self, request, pk=None):
+        stream = self.get_object()
+        data = {'stream': stream.id, **presence.stats(stream.id)}
+        response = ResponseDTO(code=200, message="Viewer stats retrieved successfully", data=data)
+        return Response(response.__dict__)
 
-class DonationViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'])
+    def donation_stats(self, request, pk=None):
+        stream = self.get_object()
+        response = ResponseDTO(code=200, message="Donation stats retrieved successfully", data=get_donation_stats(stream.id))
+        return Response(response.__dict__)
+
+
+def save_donation(serializer, donor):
+    stream = serializer.validated_data['stream']
+    if stream.streamer_id == donor.id:
+        response_data = {
+            'code': status.HTTP_400_BAD_REQUEST,
+            'message': 'You cannot donate to your own streams.',
+            'data': None
+        }
+        raise DRFValidationError(response_data)
+
+    transaction_id = uuid.uuid4()
+    with transaction.atomic():
+        serializer.save(donor=donor, transaction_id=transaction_id)
+        donation = serializer.instance
+
+        # Side effects are relayed to Celery and the channel layer after commit
+        outbox.enqueue_many([
+            ('process_donation', {'donation_id': donation.id}),
+            ('donation_email', {'donation_id': donation.id}),
+            ('stream_message', {
+                'stream_id': donation.stream_id,
+                'message': f'New donation: Rp {donation.amount}, Message: {donation.message}',
+                'kind': 'donation',
+            }),
+        ])
+
+
+class DonationViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Donation.objects.all()
     serializer_class = DonationSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['stream']
 
+    def get_permissions(self):
+        # Payment reconciliation is for the provider integration, not viewers
+        if self.action == 'batch_confirm':
+            return [permissions.IsAdminUser()]
+        return super().get_permissions()
+
     def perform_create(self, serializer):
-        stream = serializer.validated_data['stream']
-        if stream.streamer == self.request.user:
-            response_data = {
-                'code': status.HTTP_400_BAD_REQUEST,
-                'message': 'You cannot donate to your own streams.',
-                'data': None
-            }
-            raise DRFValidationError(response_data)
-
-        transaction_id = uuid.uuid4()
-        serializer.save(donor=self.request.user, transaction_id=transaction_id)
-
-        # Trigger Celery tasks asynchronously
-        process_donation.delay(serializer.instance.id)
-        send_donation_notification_email.delay(serializer.instance.id)
-
-        # Send notification to the Redis channel layer
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'stream_{serializer.instance.stream_id}',
-            {
-                'type': 'stream_message',
-                'message': f'New donation: Rp {serializer.instance.amount}, Message: {serializer.instance.message}'
-            }
-        )
+        save_donation(serializer, self.request.user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            # Re-read under a lock, so a concurrent confirm is neither missed
+            # here nor undone by saving a stale status
+            instance = Donation.objects.select_for_update().get(pk=serializer.instance.pk)
+            # What the aggregates hold for it, if it is completed
+            counted = Donation(stream_id=instance.stream_id, donor_id=instance.donor_id, amount=instance.amount)
+            serializer.instance = instance
+            donation = serializer.save()
+            if donation.status == 'completed':
+                adjust_donation_totals([(counted, -1), (donation, 1)])
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance = Donation.objects.select_for_update().get(pk=instance.pk)
+            instance.delete()
+            if instance.status == 'completed':
+                adjust_donation_totals([(instance, -1)])
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
@@ -216,30 +329,48 @@ class DonationViewSet(viewsets.ModelViewSet):
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
+        if wants_keyset(request):
+            return keyset_response(donation_reader, queryset, request, 'Donations retrieved successfully')
+
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
         response_data = {
             'code': status.HTTP_200_OK,
             'message': 'Donations retrieved successfully',
-            'data': serializer.data
+            'data': donation_reader.read(queryset)
         }
         return Response(response_data, status=status.HTTP_200_OK)
 
 
     @action(detail=True, methods=['post'])
-    def confirm(self, request, pk=None):
+    def confirm(self, request, pk=None, format=None):
         donation = self.get_object()
-        donation.status = 'completed'
-        donation.save()
+        complete_donation(donation.id)
+        donation.refresh_from_db()
         response = ResponseDTO(code=200, message="Donation confirmed", data=DonationSerializer(donation).data)
         return Response(response.__dict__)
 
+    @action(detail=False, methods=['post'])
+    def batch_confirm(self, request):
+        serializer = DonationBatchConfirmSerializer(data=request.data)
+        if not serializer.is_valid():
+            response = ResponseDTO(code=400, message="Invalid donation batch", data=serializer.errors)
+            return Response(response.__dict__, status=status.HTTP_400_BAD_REQUEST)
+
+        results = reconcile_donations([
+            (item['transaction_id'], item['status']) for item in serializer.validated_data['donations']
+        ])
+        summary = {result: 0 for result in ('completed', 'failed', 'unchanged', 'not_found', 'duplicate')}
+        for item in results:
+            summary[item['result']] += 1
+        response = ResponseDTO(code=200, message="Donations reconciled", data={'summary': summary, 'results': results})
+        return Response(response.__dict__)
+
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -247,20 +378,27 @@ class CommentViewSet(viewsets.ModelViewSet):
     filterset_fields = ['stream']
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
-
-        # Send notification to the Redis channel layer
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'stream_{serializer.instance.stream_id}',
-            {
-                'type': 'stream_message',
-                'message': f'New comment: {serializer.instance.content}'
-            }
-        )
+        stream = serializer.validated_data['stream']
+        content = serializer.validated_data['content']
+
+        # Send notification to the Redis channel layer, then persist
+        broadcast_to_stream(stream.id, f'New comment: {content}')
+        if settings.COMMENT_WRITE_BEHIND:
+            serializer.validated_data['user'] = self.request.user
+            comment_pipeline.submit(stream.id, self.request.user.id, content)
+        else:
+            serializer.save(user=self.request.user)
 
     def create(self, request, *args, **kwargs):
         response = super().create(request, *args, **kwargs)
+        if settings.COMMENT_WRITE_BEHIND:
+            response_data = {
+                'code': status.HTTP_202_ACCEPTED,
+                'message': 'Comment accepted',
+                'data': [response.data]
+            }
+            return Response(response_data, status=status.HTTP_202_ACCEPTED)
+
         response_data = {
             'code': status.HTTP_201_CREATED,
             'message': 'Comment created successfully',
@@ -271,25 +409,127 @@ class CommentViewSet(viewsets.ModelViewSet):
     def retrieve(self, request, *args, **kwargs):
         stream_id = kwargs.get('pk')
         comments = self.get_queryset().filter(stream_id=stream_id)
-        serializer = self.get_serializer(comments, many=True)
+        if wants_keyset(request):
+            return keyset_response(comment_reader, comments, request, 'Comments retrieved successfully')
+
         response_data = {
             'code': status.HTTP_200_OK,
             'message': 'Comments retrieved successfully',
-            'data': serializer.data
+            'data': comment_reader.read(comments)
         }
         return Response(response_data, status=status.HTTP_200_OK)
 
     def list(self, request, *args, **kwargs):
         queryset = self.filter_queryset(self.get_queryset())
+        if wants_keyset(request):
+            return keyset_response(comment_reader, queryset, request, 'Comments retrieved successfully')
+
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
         response_data = {
             'code': status.HTTP_200_OK,
             'message': 'Comments retrieved successfully',
-            'data': serializer.data
+            'data': comment_reader.read(queryset)
         }
         return Response(response_data, status=status.HTTP_200_OK)
+
+
+def json_response(data, status_code):
+    return HttpResponse(FastJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def bearer_token(request):
+    parts = request.headers.get('Authorization', '').split()
+    if len(parts) == 2 and parts[0] in settings.SIMPLE_JWT['AUTH_HEADER_TYPES']:
+        return parts[1]
+    return None
+
+
+def async_api_view(handler):
+    """
+    Runs ``handler(request, user, data)`` as a native async view: POST only,
+    Bearer authentication through the token cache and a JSON or form body,
+    answering errors the way the DRF views do. Like ReplicaReadMixin, a
+    successful write pins the user's reads to the primary.
+    """
+    @functools.wraps(handler)
+    async def view(request, *args, **kwargs):
+        if request.method != 'POST':
+            response = json_response({'detail': f'Method "{request.method}" not allowed.'}, 405)
+            response['Allow'] = 'POST, OPTIONS'
+            return response
+
+        token = bearer_token(request)
+        user = await authenticate_token(token, validate_access_token) if token else None
+        if user is None:
+            if token:
+                detail = {'detail': 'Given token not valid for any token type', 'code': InvalidToken.default_code}
+            else:
+                detail = {'detail': str(NotAuthenticated.default_detail)}
+            response = json_response(detail, 401)
+            response['WWW-Authenticate'] = 'Bearer realm="api"'
+            return response
+
+        if request.content_type == 'application/json':
+            try:
+                data = json.loads(request.body or b'{}')
+            except ValueError as e:
+                return json_response({'detail': f'JSON parse error - {e}'}, 400)
+        else:
+            data = request.POST
+        response = await handler(request, user, data, *args, **kwargs)
+        if response.status_code < 400:
+            await apin_user(user.id)
+        return response
+    return view
+
+
+@async_api_view
+async def create_comment(request, user, data):
+    serializer = CommentSerializer(data=data)
+    # Validation looks the stream up; that is the request's only thread hop
+    if not await database_sync_to_async(serializer.is_valid)():
+        return json_response(serializer.errors, 400)
+    stream = serializer.validated_data['stream']
+    content = serializer.validated_data['content']
+
+    await abroadcast_to_stream(stream.id, f'New comment: {content}')
+    if settings.COMMENT_WRITE_BEHIND:
+        await comment_pipeline.asubmit(stream.id, user.id, content)
+        serializer.validated_data['user'] = user
+        response = ResponseDTO(code=202, message="Comment accepted", data=[serializer.data])
+        return json_response(response.__dict__, status.HTTP_202_ACCEPTED)
+
+    comment = await Comment.objects.acreate(stream=stream, user=user, content=content)
+    response = ResponseDTO(code=201, message="Comment created successfully", data=[CommentSerializer(comment).data])
+    return json_response(response.__dict__, status.HTTP_201_CREATED)
+
+
+@async_api_view
+async def create_donation(request, user, data):
+    serializer = DonationSerializer(data=data)
+
+    # The donation and its outbox events commit together, in one hop
+    def create():
+        serializer.is_valid(raise_exception=True)
+        save_donation(serializer, user)
+
+    try:
+        await database_sync_to_async(create)()
+    except DRFValidationError as e:
+        return json_response(e.detail, status.HTTP_400_BAD_REQUEST)
+    response = ResponseDTO(code=201, message="Donation created successfully", data=serializer.data)
+    return json_response(response.__dict__, status.HTTP_201_CREATED)
+
+
+def metrics(request):
+    """Prometheus scrape endpoint, in the text exposition format."""
+    if settings.METRICS_AUTH_TOKEN:
+        token = bearer_token(request) or ''
+        if not hmac.compare_digest(token, settings.METRICS_AUTH_TOKEN):
+            return HttpResponse(status=401)
+    body = metrics_registry.registry.render()
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')